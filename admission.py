@@ -0,0 +1,237 @@
+"""
+Admission control and load shedding for Schedule Server
+Sebas Osorio
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# Answered to a client over its request rate, and when the server is full
+RATE_LIMITED = 429
+OVERLOADED = 503
+
+
+class Rejected(Exception):
+    """A request was refused admission; carries the status and Retry-After seconds."""
+
+    def __init__(self, code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """Token bucket per client address.
+
+    Each client may make burst requests at once and rate requests per
+    second after that. Buckets that have refilled completely carry no
+    state, so they are dropped when the table grows past max_clients.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 10000):
+        """
+        Args:
+            rate: Requests per second each client earns (0: unlimited)
+            burst: Requests a client may make back to back
+            max_clients: Buckets kept before idle ones are pruned
+        """
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_clients = max_clients
+        # client -> [tokens, time of last update]
+        self._buckets: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, client: str) -> float:
+        """Take a token for a request from client.
+
+        Returns:
+            0 if the request may proceed, else seconds until a token is available
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                if len(self._buckets) >= self.max_clients:
+                    self._prune(now)
+                bucket = self._buckets[client] = [self.burst, now]
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+    def _prune(self, now: float) -> None:
+        """Forget clients whose buckets are full again."""
+        refill = self.burst / self.rate
+        for client, (tokens, updated) in list(self._buckets.items()):
+            if now - updated >= refill:
+                del self._buckets[client]
+
+    def clients(self) -> int:
+        with self._lock:
+            return len(self._buckets)
+
+
+class ConcurrencyLimit:
+    """Cap on requests in flight, with a short bounded wait for a slot."""
+
+    def __init__(self, limit: int, queue_size: int, queue_timeout: float):
+        """
+        Args:
+            limit: Requests allowed in flight at once (0: unlimited)
+            queue_size: Requests that may wait for a slot; more are shed at once
+            queue_timeout: Seconds a request waits before it is shed
+        """
+        self.limit = limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> Optional[str]:
+        """Take a slot, waiting briefly if none is free.
+
+        Returns:
+            None once a slot is held, else why the request was shed
+        """
+        with self._cond:
+            if self.limit <= 0 or self.in_flight < self.limit:
+                self.in_flight += 1
+                return None
+            if self.waiting >= self.queue_size:
+                return "queue full"
+            self.waiting += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.limit:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return "queue timeout"
+                    self._cond.wait(remaining)
+                self.in_flight += 1
+                return None
+            finally:
+                self.waiting -= 1
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+
+class RouteClass:
+    """The budget shared by a group of routes: a per-client rate and a concurrency cap."""
+
+    def __init__(self, name: str, rate: float, burst: float, concurrency: int,
+                 queue_size: int, queue_timeout: float):
+        """
+        Args:
+            name: Class name, used in counters
+            rate: Requests per second per client (0: unlimited)
+            burst: Requests a client may make back to back
+            concurrency: Requests of this class in flight at once (0: unlimited)
+            queue_size: Requests that may wait for a slot
+            queue_timeout: Seconds a request waits for a slot
+        """
+        self.name = name
+        self.limiter = RateLimiter(rate, burst)
+        self.slots = ConcurrencyLimit(concurrency, queue_size, queue_timeout)
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+
+class Admission:
+    """A slot held by an admitted request, to be released once its response is sent."""
+
+    __slots__ = ('_slots',)
+
+    def __init__(self, slots: ConcurrencyLimit):
+        self._slots: Optional[ConcurrencyLimit] = slots
+
+    def release(self) -> None:
+        """Give the slot back; later calls do nothing."""
+        slots, self._slots = self._slots, None
+        if slots is not None:
+            slots.release()
+
+
+class AdmissionControl:
+    """Decides whether a request may run, per route class.
+
+    Each class has its own budget, so expensive dynamic routes can be shed
+    while cheap static files are still served. A client over its rate gets
+    429 and a request that finds its class full gets 503, both with
+    Retry-After, instead of queueing without bound.
+    """
+
+    def __init__(self, classes: Dict[str, RouteClass], retry_after: int = 1):
+        """
+        Args:
+            classes: Budgets by class name
+            retry_after: Retry-After seconds sent with 503
+        """
+        self.classes = classes
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, client: Optional[str], class_name: str) -> Iterator[None]:
+        """Hold a slot of class_name for the duration of the block.
+
+        Raises:
+            Rejected: If the client is over its rate or the class is full
+        """
+        admission = self.acquire(client, class_name)
+        try:
+            yield
+        finally:
+            admission.release()
+
+    def acquire(self, client: Optional[str], class_name: str) -> Admission:
+        """Take a slot of class_name, held until the returned Admission is released.
+
+        Engines admit a request before reading its body and release the slot
+        once the response, streamed or not, has been written.
+
+        Raises:
+            Rejected: If the client is over its rate or the class is full
+        """
+        route_class = self.classes[class_name]
+        wait = route_class.limiter.acquire(client or "-")
+        if wait:
+            with self._lock:
+                route_class.rate_limited += 1
+            raise Rejected(RATE_LIMITED, f"Rate limit exceeded for {class_name} requests",
+                           max(math.ceil(wait), 1))
+        reason = route_class.slots.acquire()
+        if reason is not None:
+            with self._lock:
+                route_class.shed += 1
+            raise Rejected(OVERLOADED, f"Server busy ({class_name} {reason})", self.retry_after)
+        with self._lock:
+            route_class.admitted += 1
+        return Admission(route_class.slots)
+
+    def stats(self) -> Dict[str, int]:
+        """Return admission counters and current load, per class."""
+        stats = {}
+        with self._lock:
+            for name, route_class in self.classes.items():
+                stats[f'{name}_admitted'] = route_class.admitted
+                stats[f'{name}_rate_limited'] = route_class.rate_limited
+                stats[f'{name}_shed'] = route_class.shed
+                stats[f'{name}_in_flight'] = route_class.slots.in_flight
+                stats[f'{name}_waiting'] = route_class.slots.waiting
+                stats[f'{name}_clients'] = route_class.limiter.clients()
+        return stats
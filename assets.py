@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+Asset fingerprinting and bundling for Schedule Server
+Sebas Osorio
+
+Stylesheets and scripts under static/css and static/js are minified and
+given content-hashed names (stylesheet.3f2a1b9c0d.css). Pages have their
+<link> and <script> references rewritten to those names as they are
+served, so the files under static/ stay as written, and a hashed name can
+be cached by browsers for a year: new content always gets a new name.
+
+As a command, writes the built assets and a manifest.json mapping the
+original names to the hashed ones, e.g. for a CDN or front proxy:
+
+    python assets.py [--out build/static] [--no-minify]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Cache-Control for fingerprinted assets
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+# Folders under the static root whose files are fingerprinted, by extension
+ASSET_FOLDERS = {"css": "css", "js": "js"}
+
+# Hex digits of the content hash put into a file name
+HASH_LENGTH = 10
+
+# Tokens of CSS source: strings are kept as they are, comments are dropped,
+# and whitespace is collapsed
+CSS_TOKEN_RE = re.compile(r'("(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\')|(/\*.*?\*/)|(\s+)', re.S)
+
+# Tokens of JS source, tried in order at each position: strings and template
+# literals, comments, a regex literal (only taken where one may start, see
+# JS_REGEX_AFTER), whitespace, then a word, ++ or --, or a single character
+JS_TOKEN_RE = re.compile(r"""
+    (?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|`(?:[^`\\]|\\.)*`)
+  | (?P<comment>/\*.*?\*/|//[^\n]*)
+  | (?P<regex>/(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*)
+  | (?P<space>\s+)
+  | (?P<word>[\w$]+|\+\+|--|.)
+""", re.S | re.X)
+
+# A '/' after one of these starts a regex literal; after anything else
+# (a name, a number, ')', ']', or a postfix ++ or --) it is division
+JS_REGEX_AFTER = frozenset("(,=:[!&|?{};+-*%<>~^") | {
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void", "throw",
+    "case", "do", "else", "yield", "await"}
+
+# Whitespace next to CSS punctuation where it never matters
+CSS_PUNCTUATION_RE = re.compile(r"\s*([{};,>])\s*")
+
+# <link rel="stylesheet" href> and <script src></script> tags, and the URL in them
+STYLESHEET_RE = re.compile(r'<link\b[^>]*\brel=["\']?stylesheet["\']?[^>]*>', re.I)
+SCRIPT_RE = re.compile(r'<script\b[^>]*\bsrc=[^>]*>\s*</script>', re.I)
+URL_ATTR_RE = re.compile(r'\b(href|src)=(["\'])([^"\']*)\2', re.I)
+
+# A local reference to an asset: any prefix, then folder/name
+ASSET_URL_RE = re.compile(r"^(?P<prefix>(?:\.\./|\./|/)*)(?P<key>(?:css|js)/[^/?#]+)$")
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and collapse whitespace, leaving strings alone.
+
+    Space before ':' is kept, since in a selector it is a descendant combinator.
+    """
+    def compact(code: str) -> str:
+        code = CSS_PUNCTUATION_RE.sub(r"\1", re.sub(r"\s+", " ", code))
+        return code.replace(";}", "}").replace(": ", ":")
+
+    pieces = []
+    code = []
+    position = 0
+    for match in CSS_TOKEN_RE.finditer(text):
+        code.append(text[position:match.start()])
+        string = match.group(1)
+        if string:
+            pieces.append(compact("".join(code)))
+            pieces.append(string)
+            code = []
+        else:
+            code.append(" ")
+        position = match.end()
+    code.append(text[position:])
+    pieces.append(compact("".join(code)))
+    return "".join(pieces).strip()
+
+
+def minify_js(text: str) -> str:
+    """Drop comments, indentation and blank lines, leaving strings and regex literals alone.
+
+    Line breaks are kept so automatic semicolon insertion works as before;
+    nothing is renamed or reordered.
+    """
+    pieces = []
+    # Separator owed before the next token: "", " " or a line break
+    gap = ""
+    previous = ""
+    position = 0
+    while position < len(text):
+        match = JS_TOKEN_RE.match(text, position)
+        kind, token = match.lastgroup, match.group()
+        if kind == "regex" and previous and previous not in JS_REGEX_AFTER:
+            # Division: take the '/' alone
+            kind, token = "word", "/"
+        position += len(token)
+        if kind == "comment" or kind == "space":
+            # A comment still separates the tokens around it
+            if "\n" in token or token.startswith("//"):
+                gap = "\n"
+            elif not gap:
+                gap = " "
+            continue
+        if gap and pieces:
+            pieces.append(gap)
+        gap = ""
+        pieces.append(token)
+        previous = token
+    return "".join(pieces)
+
+
+MINIFIERS = {"css": minify_css, "js": minify_js}
+
+
+def hashed_name(name: str, body: bytes) -> str:
+    """name.css -> name.<content hash>.css"""
+    root, extension = os.path.splitext(name)
+    digest = hashlib.blake2b(body, digest_size=HASH_LENGTH // 2).hexdigest()
+    return f"{root}.{digest}{extension}"
+
+
+class Asset:
+    """A built asset: minified body under its content-hashed name."""
+
+    __slots__ = ('name', 'body', 'etag', 'mtime')
+
+    def __init__(self, name: str, body: bytes, mtime: float):
+        """
+        Args:
+            name: Content-hashed file name
+            body: Built content
+            mtime: Modification time of the newest source file
+        """
+        self.name = name
+        self.body = body
+        self.etag = '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.mtime = mtime
+
+
+class AssetPipeline:
+    """Builds fingerprinted assets and rewrites the pages that reference them.
+
+    Every rewrite stats the source files and rebuilds the manifest if one
+    changed. Assets of the build before stay servable under their old
+    names, so a page rendered before the change still loads; older ones
+    are dropped, so edits never pile up in memory.
+    """
+
+    def __init__(self, root: str = "static", minify: bool = True, bundle: bool = False,
+                 enabled: bool = True):
+        """
+        Args:
+            root: Static directory holding css/ and js/
+            minify: Whether to minify CSS and JS
+            bundle: Whether adjacent stylesheet links, and adjacent script
+                tags, in a page are merged into one file
+            enabled: If false, pages are left as they are and nothing is served
+        """
+        self.root = root
+        self.minify = minify
+        self.bundle = bundle
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # Source stat data the manifest was built from
+        self._sources: Dict[str, Tuple[int, int]] = {}
+        # 'css/stylesheet.css' -> 'css/stylesheet.3f2a1b9c0d.css'
+        self.manifest: Dict[str, str] = {}
+        self._bodies: Dict[str, bytes] = {}
+        # Servable assets by hashed name, of this build and of the one before
+        self._assets: Dict[str, Asset] = {}
+        self._previous: Dict[str, Asset] = {}
+        self._bundles: Dict[Tuple[str, ...], str] = {}
+        # Rewritten pages: path -> ((source ETag, version), body, ETag)
+        self._pages: Dict[str, Tuple[Tuple[str, str], bytes, str]] = {}
+        self.version = ""
+        self.builds = 0
+        if enabled:
+            self.refresh()
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        """Stat every asset source, keyed by folder/name."""
+        sources = {}
+        for extension, folder in ASSET_FOLDERS.items():
+            directory = os.path.join(self.root, folder)
+            try:
+                names = os.listdir(directory)
+            except FileNotFoundError:
+                continue
+            for name in names:
+                if name.endswith("." + extension):
+                    st = os.stat(os.path.join(directory, name))
+                    sources[f"{folder}/{name}"] = (st.st_mtime_ns, st.st_size)
+        return sources
+
+    def refresh(self) -> None:
+        """Rebuild the manifest if an asset source was added, removed or changed."""
+        sources = self._scan()
+        if sources == self._sources:
+            return
+        with self._lock:
+            if sources == self._sources:
+                return
+            manifest, bodies = {}, {}
+            self._previous, self._assets = self._assets, {}
+            for key, (mtime_ns, _) in sorted(sources.items()):
+                with open(os.path.join(self.root, key), "r", encoding="utf-8") as f:
+                    text = f.read()
+                extension = key.rpartition(".")[2]
+                if self.minify:
+                    text = MINIFIERS[extension](text)
+                body = text.encode("utf-8")
+                folder, _, name = key.partition("/")
+                manifest[key] = f"{folder}/{hashed_name(name, body)}"
+                bodies[key] = body
+                self._add(Asset(os.path.basename(manifest[key]), body, mtime_ns / 1e9))
+            self.manifest, self._bodies, self._bundles = manifest, bodies, {}
+            self._sources = sources
+            self.version = hashlib.blake2b(json.dumps(manifest, sort_keys=True).encode("utf-8"),
+                                           digest_size=8).hexdigest()
+            self.builds += 1
+
+    def _add(self, asset: Asset) -> None:
+        self._assets[asset.name] = asset
+
+    def get(self, name: str) -> Optional[Asset]:
+        """Look up a built asset by its hashed file name."""
+        return self._assets.get(name) or self._previous.get(name)
+
+    def current_version(self) -> str:
+        """Refresh, then return a token that changes whenever the manifest does."""
+        if self.enabled:
+            self.refresh()
+        return self.version
+
+    def rewrite(self, html: str) -> str:
+        """Point a page's stylesheet links and script tags at the hashed assets."""
+        if not self.enabled:
+            return html
+        self.refresh()
+        html = self._rewrite_tags(STYLESHEET_RE, html)
+        return self._rewrite_tags(SCRIPT_RE, html)
+
+    def page(self, key: str, etag: str, body: bytes) -> Tuple[bytes, str]:
+        """Rewrite a page read from disk, caching the result per source ETag and manifest.
+
+        Args:
+            key: Path of the page
+            etag: Entity tag of the page as stored
+            body: The page as stored
+
+        Returns:
+            (rewritten page, its entity tag)
+        """
+        if not self.enabled:
+            return body, etag
+        self.refresh()
+        stamp = (etag, self.version)
+        cached = self._pages.get(key)
+        if cached is None or cached[0] != stamp:
+            rewritten = self.rewrite(body.decode("utf-8", "surrogateescape")).encode("utf-8", "surrogateescape")
+            cached = self._pages[key] = (
+                stamp, rewritten, '"' + hashlib.blake2b(rewritten, digest_size=16).hexdigest() + '"')
+        return cached[1], cached[2]
+
+    def _rewrite_tags(self, tag_re: "re.Pattern", html: str) -> str:
+        """Rewrite the tags tag_re matches, merging runs of adjacent ones when bundling."""
+        out = []
+        position = 0
+        run: List[Tuple["re.Match", str, str]] = []
+
+        def flush() -> None:
+            if not run:
+                return
+            if len(run) > 1:
+                out.append(self._bundle_tag(run))
+            else:
+                out.append(self._retarget(*run[0]))
+            run.clear()
+
+        for match in tag_re.finditer(html):
+            between = html[position:match.start()]
+            reference = self._reference(match.group(0))
+            if run and (between.strip() or reference is None or not self.bundle
+                        or self._shape(match.group(0)) != self._shape(run[-1][0].group(0))):
+                flush()
+            if not run:
+                out.append(between)
+            if reference is None:
+                out.append(match.group(0))
+            else:
+                run.append((match, *reference))
+            position = match.end()
+        flush()
+        out.append(html[position:])
+        return "".join(out)
+
+    def _reference(self, tag: str) -> Optional[Tuple[str, str]]:
+        """(URL prefix, manifest key) of a tag's local asset, or None for anything else."""
+        url = URL_ATTR_RE.search(tag)
+        if url is None:
+            return None
+        reference = ASSET_URL_RE.match(url.group(3))
+        if reference is None or reference.group("key") not in self.manifest:
+            return None
+        return reference.group("prefix"), reference.group("key")
+
+    @staticmethod
+    def _shape(tag: str) -> str:
+        """A tag with its URL blanked out; only tags of the same shape are bundled."""
+        return URL_ATTR_RE.sub(r"\1=", tag)
+
+    def _retarget(self, match: "re.Match", prefix: str, key: str, target: Optional[str] = None) -> str:
+        target = target or self.manifest[key]
+        return URL_ATTR_RE.sub(lambda url: f"{url.group(1)}={url.group(2)}{prefix}{target}{url.group(2)}",
+                               match.group(0), count=1)
+
+    def _bundle_tag(self, run: List[Tuple["re.Match", str, str]]) -> str:
+        """Concatenate a run of assets into one bundle and return the tag loading it."""
+        keys = tuple(key for _, _, key in run)
+        with self._lock:
+            target = self._bundles.get(keys)
+            if target is None:
+                folder, _, first = keys[0].partition("/")
+                extension = first.rpartition(".")[2]
+                separator = b"\n" if extension == "css" else b";\n"
+                body = separator.join(self._bodies[key] for key in keys)
+                target = f"{folder}/{hashed_name('bundle.' + extension, body)}"
+                mtime = max(self._sources[key][0] for key in keys) / 1e9
+                self._add(Asset(os.path.basename(target), body, mtime))
+                self._bundles[keys] = target
+        match, prefix, key = run[0]
+        return self._retarget(match, prefix, key, target)
+
+    def write(self, directory: str) -> Dict[str, str]:
+        """Write every built asset under directory, with a manifest.json.
+
+        Returns:
+            The manifest
+        """
+        self.refresh()
+        for key, target in self.manifest.items():
+            path = os.path.join(directory, target)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(self._bodies[key])
+        with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return self.manifest
+
+    def stats(self) -> Dict[str, int]:
+        """Return build counters."""
+        with self._lock:
+            return {
+                'assets': len(self.manifest),
+                'servable': len(self._assets.keys() | self._previous.keys()),
+                'bundles': len(self._bundles),
+                'pages': len(self._pages),
+                'builds': self.builds,
+            }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build fingerprinted CSS and JS assets.")
+    parser.add_argument("--root", default="static", help="static directory holding css/ and js/")
+    parser.add_argument("--out", default="build/static", help="where the hashed files are written")
+    parser.add_argument("--no-minify", action="store_true", help="copy the sources as they are")
+    args = parser.parse_args(argv)
+    pipeline = AssetPipeline(args.root, minify=not args.no_minify)
+    for key, target in pipeline.write(args.out).items():
+        before = os.path.getsize(os.path.join(args.root, key))
+        after = len(pipeline.get(os.path.basename(target)).body)
+        print(f"{key} -> {target} ({before} -> {after} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
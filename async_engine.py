@@ -0,0 +1,404 @@
+"""
+asyncio server engine for Schedule Server
+Sebas Osorio
+"""
+
+import asyncio
+import html
+import logging
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, DEFAULT_ERROR_MESSAGE, DEFAULT_ERROR_CONTENT_TYPE
+from typing import Callable, Dict, Optional, Tuple
+
+from admission import Admission
+from body_parser import BODY_CHUNK, Body, BodyError, BodyParser, declares_body, make_parser
+from metrics import Metrics
+from profiling import Profiler, Trace
+from ranges import FileBody
+from streaming import LAST_CHUNK, StreamBody, encode_chunk
+
+logger = logging.getLogger('personal_website')
+
+# Same limits http.server applies to request and header lines
+MAX_LINE = 65536
+MAX_HEADERS = 100
+
+SERVER_HEADER = BaseHTTPRequestHandler.server_version + " " + BaseHTTPRequestHandler.sys_version
+REASONS = {code: reason for code, (reason, _) in BaseHTTPRequestHandler.responses.items()}
+EXPLAIN = {code: explain for code, (_, explain) in BaseHTTPRequestHandler.responses.items()}
+
+# (response body, status code, headers), as returned by server.build_response
+ResponseBuilder = Callable[..., Tuple[bytes, int, Dict[str, str]]]
+
+# Admits a request by (method, path, client address) before its body is read:
+# (admission to release once the response is sent, None) or (None, rejection response)
+Admitter = Callable[[str, str, str], Tuple[Optional[Admission], Optional[Tuple[bytes, int, Dict[str, str]]]]]
+
+# Picks the parser for a request body from its headers, or None without a body
+BodyParserFactory = Callable[[Dict[str, str]], Optional[BodyParser]]
+
+
+class BadRequest(Exception):
+    """Raised when a request cannot be parsed; carries the status to answer with."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def render_head(code: int, headers: Dict[str, str], length: Optional[int],
+                connection_headers: Dict[str, str]) -> bytes:
+    """Serialise the status line and headers the way RequestHandler sends them.
+
+    A length of None marks a streamed body, whose framing is left to
+    connection_headers (Transfer-Encoding, or Connection: close).
+    """
+    lines = [
+        f"HTTP/1.1 {code} {REASONS.get(code, '')}",
+        f"Server: {SERVER_HEADER}",
+        f"Date: {formatdate(usegmt=True)}",
+    ]
+    for key, value in headers.items():
+        lines.append(f"{key}: {value}")
+    if length is not None and code != 304:
+        lines.append(f"Content-Length: {length}")
+    lines.append("X-Content-Type-Options: nosniff")
+    for key, value in connection_headers.items():
+        lines.append(f"{key}: {value}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "strict")
+
+
+def render_error(code: int, message: str) -> Tuple[bytes, bytes]:
+    """Build an error response matching BaseHTTPRequestHandler.send_error()."""
+    body = (DEFAULT_ERROR_MESSAGE % {
+        'code': code,
+        'message': html.escape(message, quote=False),
+        'explain': html.escape(EXPLAIN.get(code, ''), quote=False),
+    }).encode('UTF-8', 'replace')
+    lines = [
+        f"HTTP/1.1 {code} {message}",
+        f"Server: {SERVER_HEADER}",
+        f"Date: {formatdate(usegmt=True)}",
+        "Connection: close",
+        f"Content-Type: {DEFAULT_ERROR_CONTENT_TYPE}",
+        f"Content-Length: {len(body)}",
+    ]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "strict"), body
+
+
+async def read_line(reader: asyncio.StreamReader, code: int, message: str) -> bytes:
+    """Read a CRLF-terminated line, turning an over-long line into a BadRequest."""
+    try:
+        return await reader.readline()
+    except ValueError:
+        raise BadRequest(code, message)
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, str, Dict[str, str], float]]:
+    """Read the request line and headers of one request off the stream.
+
+    Returns:
+        (method, path, version, headers, perf_counter() when the request
+        line arrived), or None if the client closed the connection between
+        requests
+
+    Raises:
+        BadRequest: If the request line or headers are malformed
+    """
+    request_line = await read_line(reader, 414, "Request-URI Too Long")
+    if not request_line:
+        return None
+    started = time.perf_counter()
+
+    words = request_line.decode("iso-8859-1").rstrip("\r\n").split()
+    if len(words) != 3 or not words[2].startswith("HTTP/"):
+        raise BadRequest(400, f"Bad request syntax ({request_line!r})")
+    method, path, version = words
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await read_line(reader, 431, "Line too long")
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise BadRequest(431, "Too many headers")
+        name, sep, value = line.decode("iso-8859-1").partition(":")
+        if not sep:
+            raise BadRequest(400, "Bad header line")
+        headers[name.strip().lower()] = value.strip()
+    return method, path, version, headers, started
+
+
+async def read_body(reader: asyncio.StreamReader, parser: BodyParser, timeout: float,
+                    executor: Optional[ThreadPoolExecutor] = None) -> Body:
+    """Feed a request body to its parser a chunk at a time.
+
+    A parser that writes to disk is fed on the executor. The timeout
+    applies to each chunk, so a slow but steady upload is not cut off.
+
+    Raises:
+        BadRequest: If the body is malformed, too large or stops arriving
+    """
+    loop = asyncio.get_running_loop()
+    remaining = parser.length
+    try:
+        while remaining:
+            chunk = await asyncio.wait_for(reader.read(min(BODY_CHUNK, remaining)), timeout)
+            if not chunk:
+                raise BodyError(400, "Request body ended early")
+            if parser.blocking:
+                await loop.run_in_executor(executor, parser.feed, chunk)
+            else:
+                parser.feed(chunk)
+            remaining -= len(chunk)
+        return parser.finish()
+    except BodyError as e:
+        parser.abort()
+        raise BadRequest(e.code, e.message)
+    except BaseException:
+        parser.abort()
+        raise
+
+
+def unlimited_body(headers: Dict[str, str]) -> Optional[BodyParser]:
+    """Parser choice when the server sets no limits: everything in memory or a temp dir."""
+    return make_parser(headers, sys.maxsize, sys.maxsize, tempfile.gettempdir())
+
+
+def wants_keep_alive(version: str, headers: Dict[str, str]) -> bool:
+    """Apply HTTP/1.0 and HTTP/1.1 default persistence rules."""
+    connection = headers.get("connection", "").lower()
+    if version == "HTTP/1.1":
+        return connection != "close"
+    return connection == "keep-alive"
+
+
+class AsyncServer:
+    """HTTP/1.1 server on asyncio streams.
+
+    Connections are coroutines, so idle keep-alive clients cost no threads.
+    Routing and file access run in build_response on a thread pool, and
+    binary files go out with loop.sendfile, so disk I/O never blocks the
+    event loop.
+    """
+
+    def __init__(self, build_response: ResponseBuilder, workers: int = 8,
+                 idle_timeout: float = 5.0, max_requests: int = 100,
+                 metrics: Optional[Metrics] = None, profiler: Optional[Profiler] = None,
+                 body_parser: Optional[BodyParserFactory] = None, admit: Optional[Admitter] = None):
+        """
+        Args:
+            build_response: Turns (method, path, body, headers) into a response
+            workers: Threads that run build_response
+            idle_timeout: Seconds an idle keep-alive connection is kept open,
+                and that a request body may stall for
+            max_requests: Requests served on one connection before closing it
+            metrics: Records parse/send latency and responses per route
+            profiler: Finishes the trace build_response leaves on its thread
+                with the parse and send timings
+            body_parser: Chooses the parser for a request body; bodies are
+                skipped without one
+            admit: Admits or sheds a request before its body is read; every
+                request is served without one
+        """
+        self.build_response = build_response
+        self.body_parser = body_parser or unlimited_body
+        self.admit = admit
+        self.metrics = metrics
+        self.profiler = profiler
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="async-worker")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve requests on one connection until it closes or goes idle."""
+        loop = asyncio.get_running_loop()
+        peer = writer.get_extra_info("peername") or ("-", 0)
+        requests_handled = 0
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), self.idle_timeout)
+                except BadRequest as e:
+                    head, body = render_error(e.code, e.message)
+                    writer.write(head + body)
+                    await writer.drain()
+                    return
+                if request is None:
+                    return
+                method, path, version, headers, parse_started = request
+
+                if method not in ("GET", "POST"):
+                    head, body = render_error(501, f"Unsupported method ({method!r})")
+                    writer.write(head + body)
+                    await writer.drain()
+                    return
+
+                admission, rejection = None, None
+                if self.admit is not None:
+                    # Before the body is read, so a shed request costs no upload
+                    admission, rejection = await loop.run_in_executor(
+                        self.executor, self.admit, method, path, peer[0])
+                try:
+                    if rejection is not None:
+                        parse_seconds = time.perf_counter() - parse_started
+                        keep_alive = await self.respond(writer, peer, method, path, version, headers, rejection,
+                                                        None, None, parse_seconds, requests_handled + 1,
+                                                        unread_body=declares_body(headers))
+                    else:
+                        try:
+                            try:
+                                parser = self.body_parser(headers)
+                            except BodyError as e:
+                                raise BadRequest(e.code, e.message)
+                            body = await read_body(reader, parser, self.idle_timeout, self.executor) if parser else None
+                        except BadRequest as e:
+                            # The rest of the body is unread, so the connection cannot be reused
+                            logger.error(f"Refused request body for {path}: {e.message}")
+                            head, error_body = render_error(e.code, e.message)
+                            writer.write(head + error_body)
+                            await writer.drain()
+                            return
+                        parse_seconds = time.perf_counter() - parse_started
+                        if method != "POST" and body is not None:
+                            body.discard()
+                            body = None
+                        response, route, trace = await loop.run_in_executor(
+                            self.executor, self._build, method, path, body, headers)
+                        keep_alive = await self.respond(writer, peer, method, path, version, headers, response,
+                                                        route, trace, parse_seconds, requests_handled + 1)
+                finally:
+                    # Held until the whole response, streamed or not, has been written
+                    if admission is not None:
+                        admission.release()
+                requests_handled += 1
+                if not keep_alive:
+                    return
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer: asyncio.StreamWriter, peer: Tuple[str, int], method: str, path: str,
+                      version: str, headers: Dict[str, str], response: Tuple[bytes, int, Dict[str, str]],
+                      route: Optional[str], trace: Optional[Trace], parse_seconds: float,
+                      requests_handled: int, unread_body: bool = False) -> bool:
+        """Send a response on the connection and record its timings.
+
+        Args:
+            requests_handled: Requests served on the connection, this one included
+            unread_body: Whether the request body was left unread, so the
+                connection cannot be reused
+
+        Returns:
+            Whether the connection stays open for another request
+        """
+        loop = asyncio.get_running_loop()
+        message, code, response_headers = response
+        if self.metrics:
+            self.metrics.observe(route, "parse", parse_seconds)
+        started = time.perf_counter()
+
+        keep_alive = (not unread_body and wants_keep_alive(version, headers)
+                      and requests_handled < self.max_requests)
+        streamed = isinstance(message, StreamBody)
+        if streamed and version == "HTTP/1.0":
+            # No chunked encoding in HTTP/1.0; closing marks the end of the body
+            keep_alive = False
+        connection_headers = {}
+        if streamed and version != "HTTP/1.0":
+            connection_headers["Transfer-Encoding"] = "chunked"
+        if not keep_alive:
+            connection_headers["Connection"] = "close"
+        else:
+            if version == "HTTP/1.0":
+                connection_headers["Connection"] = "keep-alive"
+            remaining = self.max_requests - requests_handled
+            connection_headers["Keep-Alive"] = f"timeout={int(self.idle_timeout)}, max={remaining}"
+
+        if isinstance(message, FileBody):
+            file = await loop.run_in_executor(self.executor, message.open)
+            with file:
+                writer.write(render_head(code, response_headers, len(message), connection_headers))
+                await self.send_file(writer, file, message)
+        elif streamed:
+            writer.write(render_head(code, response_headers, None, connection_headers))
+            sent = await self.send_stream(writer, message, chunked="Transfer-Encoding" in connection_headers)
+        else:
+            writer.write(render_head(code, response_headers, len(message), connection_headers))
+            writer.write(message)
+            await writer.drain()
+        send_seconds = time.perf_counter() - started
+        if self.metrics:
+            self.metrics.observe(route, "send", send_seconds)
+            self.metrics.count_response(route, code, sent if streamed else len(message))
+        if trace is not None:
+            self.profiler.finish(trace, parse_seconds, send_seconds)
+        logger.info(f'{peer[0]}:{peer[1]} "{method} {path} {version}" '
+                    f"{code} conn-request={requests_handled}")
+        return keep_alive
+
+    async def send_file(self, writer: asyncio.StreamWriter, file, body: FileBody) -> None:
+        """Copy a FileBody to the transport with sendfile (or chunked reads as a fallback)."""
+        loop = asyncio.get_running_loop()
+        for part in body.parts:
+            if isinstance(part, bytes):
+                writer.write(part)
+                continue
+            await writer.drain()
+            offset, count = part
+            await loop.sendfile(writer.transport, file, offset, count)
+        await writer.drain()
+
+    async def send_stream(self, writer: asyncio.StreamWriter, body: StreamBody, chunked: bool) -> int:
+        """Write a StreamBody as the executor produces it, chunk-framed unless HTTP/1.0.
+
+        Returns:
+            Number of body bytes sent, not counting chunk framing
+        """
+        loop = asyncio.get_running_loop()
+        chunks = iter(body)
+        sent = 0
+        while True:
+            chunk = await loop.run_in_executor(self.executor, next, chunks, None)
+            if chunk is None:
+                break
+            writer.write(encode_chunk(chunk) if chunked else chunk)
+            sent += len(chunk)
+            await writer.drain()
+        if chunked:
+            writer.write(LAST_CHUNK)
+        await writer.drain()
+        return sent
+
+    def _build(self, method: str, path: str, body: Optional[Body], headers: Dict[str, str]
+               ) -> Tuple[Tuple[bytes, int, Dict[str, str]], Optional[str], Optional[Trace]]:
+        """Build a response on an executor thread, noting which route handled it and its trace."""
+        response = self.build_response(method, path, body, headers)
+        return (response, self.metrics.take_route() if self.metrics else None,
+                self.profiler.take() if self.profiler else None)
+
+    async def serve(self, host: str, port: int, reuse_port: bool = False,
+                    sock: Optional[socket.socket] = None) -> None:
+        """Accept connections forever, on a new socket or an inherited listening one."""
+        if sock is not None:
+            server = await asyncio.start_server(self.handle_connection, sock=sock, limit=MAX_LINE + 1)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port,
+                                                reuse_port=reuse_port or None, limit=MAX_LINE + 1)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, host: str, port: int, reuse_port: bool = False,
+            sock: Optional[socket.socket] = None) -> None:
+        """Run the server until interrupted, then release the worker threads."""
+        try:
+            asyncio.run(self.serve(host, port, reuse_port, sock))
+        finally:
+            self.executor.shutdown(wait=True)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark: route table dispatch vs. the old basename if/elif chain
+Sebas Osorio
+
+Only the routing decision is timed; no handler runs and no file is read.
+
+Usage:
+    python bench/dispatch_bench.py [iterations]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from server import CONTENT_FOLDERS, MIME_TYPES, BINARY_TYPES, ROUTER, parse_form_data  # noqa: E402
+
+# (method, url, body) samples covering every route
+SAMPLES = [
+    ("GET", "/html/MySchedule.html", None),
+    ("GET", "/css/stylesheet.css", None),
+    ("GET", "/img/Bruininks.jpg", None),
+    ("GET", "/audio/funky_jam.mp3", None),
+    ("GET", "/js/mapsSchedule.js", None),
+    ("GET", "/html/SubmissionHistory.html", None),
+    ("POST", "/html/EventLog.html", "eventname=Lecture&dayofweek=Mon&starttime=09%3A00&endtime=10%3A00"),
+    ("GET", "/calculator?digit1=3&operator=plus&digit2=4", None),
+    ("GET", "/redirect?searchterm=gophers&searchsource=google", None),
+    ("GET", "/html/explorer.html", None),
+]
+
+
+def legacy_dispatch(url, body=None):
+    """The routing work handle_request did before the route table, minus file I/O."""
+    url_parts = url.split("?", 1)
+    url_path = url_parts[0]
+    parameters = parse_form_data(body) if body else {}
+    basename = os.path.basename(url_path)
+    root, extension = os.path.splitext(basename)
+    extension = extension[1:] if extension else ""
+    folder = CONTENT_FOLDERS.get(extension, "text")
+    mime = MIME_TYPES.get(extension, "text/plain")
+    if extension in BINARY_TYPES:
+        return "static"
+    if basename == "EventLog.html":
+        return "event_log"
+    elif basename == "SubmissionHistory.html":
+        return "submission_history"
+    elif basename == "redirect":
+        return "redirect"
+    elif basename == "calculator":
+        return "calculator"
+    elif basename == "explorer.html":
+        return "explorer"
+    elif basename == "stockQuotes.html":
+        return "stock_quotes"
+    elif basename == "MySchedule.html":
+        return "schedule"
+    return "static"
+
+
+def router_dispatch(method, url, body=None):
+    """Route table lookup, including the body parse only routes that declare it get."""
+    url_path, _, _ = url.partition("?")
+    route, _ = ROUTER.match(method, url_path)
+    if route.needs_body and body:
+        parse_form_data(body)
+    return route.name
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    legacy = timeit.timeit(
+        lambda: [legacy_dispatch(url, body) for _, url, body in SAMPLES], number=iterations)
+    routed = timeit.timeit(
+        lambda: [router_dispatch(method, url, body) for method, url, body in SAMPLES], number=iterations)
+
+    per_request = 1e9 / (iterations * len(SAMPLES))
+    print(f"{'legacy if/elif chain':<24}{legacy * per_request:8.0f} ns/request")
+    print(f"{'route table':<24}{routed * per_request:8.0f} ns/request")
+    print(f"speedup: {legacy / routed:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
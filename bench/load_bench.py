@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+Load test: throughput and latency percentiles of every route of Schedule Server
+Sebas Osorio
+
+Starts server.py in a scratch directory, on an ephemeral localhost port, in
+the --mode concurrency mode (threaded by default: single mode serves one
+connection at a time, which would measure connection scheduling rather
+than the routes), with an event store preloaded with --events events. It
+then drives each route in turn from --concurrency keep-alive connections
+(an asyncio client; nothing leaves the machine). Results are printed as a
+table and can be written as JSON with --output. A JSON file from an
+earlier run can be passed as --baseline (bench/baseline.json is the
+committed one): a route whose throughput fell, or whose p95 latency rose,
+by more than --threshold (a fraction) is reported as a regression and the
+exit status is 1.
+
+Usage:
+    python bench/load_bench.py [--mode threaded] [--requests 2000] [--concurrency 16]
+                               [--events 1000] [--routes css,explorer] [--env KEY=VALUE]
+                               [--output results.json] [--baseline bench/baseline.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from event_store import make_record  # noqa: E402
+
+# (name, method, path, form body) for every route, in the order they are run.
+# The history is read before EventLog posts add to it, so it always holds
+# exactly the preloaded events.
+ROUTES = [
+    ("static_html", "GET", "/html/MySchedule.html", None),
+    ("css", "GET", "/css/stylesheet.css", None),
+    ("jpg", "GET", "/img/smith.jpg", None),
+    ("mp3", "GET", "/audio/funky_jam.mp3", None),
+    ("calculator", "GET", "/calculator?digit1=3&operator=plus&digit2=4", None),
+    ("redirect", "GET", "/redirect?searchterm=gophers&searchsource=google", None),
+    ("explorer", "GET", "/html/explorer.html", None),
+    ("submission_history", "GET", "/html/SubmissionHistory.html", None),
+    ("event_log", "POST", "/html/EventLog.html",
+     "eventname=Lecture&dayofweek=Mon&starttime=09%3A00&endtime=10%3A00&location=Smith"),
+]
+
+# Server concurrency modes that can be benchmarked
+MODES = ("single", "threaded", "pool", "async")
+
+# Seconds to wait for the server to accept connections
+STARTUP_TIMEOUT = 15.0
+
+
+def free_port() -> int:
+    """Ask the kernel for an unused localhost port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_events(path: str, count: int) -> None:
+    """Fill an event store file with count distinct events."""
+    days = ("Mon", "Tue", "Wed", "Thu", "Fri")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            hour = 8 + i % 10
+            f.write(json.dumps(make_record({
+                "eventname": f"Event {i}",
+                "dayofweek": days[i % len(days)],
+                "starttime": f"{hour:02d}:00",
+                "endtime": f"{hour:02d}:50",
+                "location": f"Room {i % 40}",
+                "extrainfo": "Preloaded for the load test",
+            }), separators=(",", ":")) + "\n")
+
+
+def start_server(port: int, workdir: str, events: int, env: Dict[str, str]) -> subprocess.Popen:
+    """Run server.py in workdir and wait until it accepts connections.
+
+    The server writes its logs and caches into its working directory, so it
+    runs in workdir with static/ linked in rather than in the repository.
+
+    Raises:
+        RuntimeError: If the server exits or does not start listening in time
+    """
+    events_file = os.path.join(workdir, "events.jsonl")
+    write_events(events_file, events)
+    server_env = dict(os.environ, HOST="127.0.0.1", PORT=str(port), EVENTS_FILE=events_file,
+                      EVENTS_FSYNC="false", LOG_FILE=os.path.join(workdir, "response.log"),
+                      # Every request comes from one address; per-client limits would
+                      # measure the rate limiter rather than the route
+                      RATE_LIMIT_STATIC_RPS="0", RATE_LIMIT_DYNAMIC_RPS="0")
+    server_env.update(env)
+    os.symlink(os.path.join(ROOT, "static"), os.path.join(workdir, "static"))
+    server_env.setdefault("FILES_DIR", os.path.join(ROOT, "files"))
+    output = open(os.path.join(workdir, "server.out"), "w")
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py")], cwd=workdir,
+                               env=server_env, stdout=output, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py exited with status {process.returncode}; "
+                               f"see {output.name}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.05)
+    stop_server(process)
+    raise RuntimeError(f"server.py did not listen on port {port} within {STARTUP_TIMEOUT:.0f}s")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    """Ask the server to shut down, killing it if it does not."""
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 client connection, reopened when the server closes it."""
+
+    def __init__(self, port: int):
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, message: bytes) -> Tuple[int, int]:
+        """Send a request and read the whole response.
+
+        Returns:
+            (status code, body bytes)
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        self.writer.write(message)
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("latin-1").split("\r\n")
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get("transfer-encoding") == "chunked":
+            size = 0
+            while True:
+                length = int((await self.reader.readline()).split(b";")[0], 16)
+                if not length:
+                    await self.reader.readline()
+                    break
+                size += len(await self.reader.readexactly(length + 2)) - 2
+        elif "content-length" in headers:
+            size = len(await self.reader.readexactly(int(headers["content-length"])))
+        else:
+            size = len(await self.reader.read())
+            headers["connection"] = "close"
+
+        if headers.get("connection") == "close":
+            self.close()
+        return status, size
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def build_request(method: str, path: str, body: Optional[str]) -> bytes:
+    """Serialise an HTTP/1.1 request."""
+    lines = [f"{method} {path} HTTP/1.1", "Host: localhost", "Accept-Encoding: identity"]
+    data = (body or "").encode("utf-8")
+    if body is not None:
+        lines.append("Content-Type: application/x-www-form-urlencoded")
+        lines.append(f"Content-Length: {len(data)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data
+
+
+async def drive(port: int, message: bytes, requests: int, concurrency: int) -> Dict[str, object]:
+    """Send requests copies of message from concurrency connections and time each one."""
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    body_bytes = 0
+    remaining = requests
+
+    async def client() -> None:
+        nonlocal remaining, errors, body_bytes
+        connection = Connection(port)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    status, size = await connection.request(message)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    connection.close()
+                    continue
+                latencies.append(time.perf_counter() - started)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                body_bytes += size
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(min(concurrency, requests))))
+    elapsed = time.perf_counter() - started
+    return summarise(latencies, elapsed, statuses, errors, body_bytes)
+
+
+def percentile(ordered: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values, in milliseconds."""
+    if not ordered:
+        return 0.0
+    index = min(max(int(round(fraction * len(ordered) + 0.5)) - 1, 0), len(ordered) - 1)
+    return ordered[index] * 1000
+
+
+def summarise(latencies: List[float], elapsed: float, statuses: Dict[str, int], errors: int,
+              body_bytes: int) -> Dict[str, object]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "status": statuses,
+        "seconds": round(elapsed, 4),
+        "rps": round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 0.50), 3),
+        "p95_ms": round(percentile(ordered, 0.95), 3),
+        "p99_ms": round(percentile(ordered, 0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        "bytes": body_bytes,
+    }
+
+
+def compare(results: Dict[str, Dict[str, object]], baseline: Dict[str, Dict[str, object]],
+            threshold: float) -> List[str]:
+    """List the routes that regressed against a baseline by more than threshold."""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if before["rps"] and current["rps"] < before["rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {before['rps']} -> {current['rps']} req/s")
+        if before["p95_ms"] and current["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {current['p95_ms']} ms")
+        if current["errors"] > before["errors"]:
+            regressions.append(f"{name}: errors {before['errors']} -> {current['errors']}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, object]]) -> None:
+    print(f"{'route':<20}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  status")
+    for name, result in results.items():
+        status = ",".join(f"{code}x{count}" for code, count in sorted(result["status"].items()))
+        print(f"{name:<20}{result['rps']:>10.1f}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}"
+              f"{result['p99_ms']:>10.3f}{result['errors']:>8}  {status}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--mode", choices=MODES, default="threaded", help="server concurrency mode")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per route")
+    parser.add_argument("--warmup", type=int, default=100, help="untimed requests per route first")
+    parser.add_argument("--concurrency", type=int, default=16, help="simultaneous connections")
+    parser.add_argument("--events", type=int, default=1000,
+                        help="events preloaded for the submission history")
+    parser.add_argument("--routes", help="comma-separated route names (default: all)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra server configuration, e.g. WORKERS=16")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="allowed fractional slowdown before a route counts as regressed")
+    args = parser.parse_args(argv)
+    names = [name for name, _, _, _ in ROUTES]
+    args.routes = args.routes.split(",") if args.routes else names
+    unknown = set(args.routes) - set(names)
+    if unknown:
+        parser.error(f"unknown routes: {', '.join(sorted(unknown))}; choose from {', '.join(names)}")
+    for setting in args.env:
+        if "=" not in setting:
+            parser.error(f"--env expects KEY=VALUE, not {setting!r}")
+        if setting.startswith("SERVER_MODE="):
+            parser.error("choose the server mode with --mode")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    env = dict(setting.split("=", 1) for setting in args.env)
+    env["SERVER_MODE"] = args.mode
+    port = free_port()
+
+    results: Dict[str, Dict[str, object]] = {}
+    with tempfile.TemporaryDirectory(prefix="schedule-bench-") as workdir:
+        server = start_server(port, workdir, args.events, env)
+        try:
+            for name, method, path, body in ROUTES:
+                if name not in args.routes:
+                    continue
+                message = build_request(method, path, body)
+                if args.warmup:
+                    asyncio.run(drive(port, message, args.warmup, args.concurrency))
+                results[name] = asyncio.run(drive(port, message, args.requests, args.concurrency))
+        finally:
+            stop_server(server)
+
+    print_table(results)
+    report = {
+        "config": {
+            "mode": args.mode,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "events": args.events,
+            "env": env,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "routes": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        baseline_mode = baseline.get("config", {}).get("mode")
+        if baseline_mode != args.mode:
+            print(f"\nWarning: {args.baseline} was measured in {baseline_mode or 'an unrecorded'} mode, "
+                  f"this run in {args.mode} mode")
+        regressions = compare(results, baseline.get("routes", {}), args.threshold)
+        if regressions:
+            print(f"\nRegressions beyond {args.threshold:.0%} of {args.baseline}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo route regressed beyond {args.threshold:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Incremental request body parsing for Schedule Server
+Sebas Osorio
+"""
+
+import os
+import re
+import tempfile
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+from urllib.parse import unquote_plus
+
+# Bytes read off the socket and fed to a parser at a time
+BODY_CHUNK = 64 * 1024
+
+# Longest header block a multipart part may have
+MAX_PART_HEADERS = 8192
+
+# name="value" parameters of a Content-Type or Content-Disposition header
+PARAM_RE = re.compile(r';\s*([A-Za-z0-9_*.-]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+# Characters of a raw body shown when it is logged
+LOG_BODY_CHARS = 4096
+
+# Characters kept in the name an upload is saved under
+UNSAFE_FILENAME_RE = re.compile(r"[^A-Za-z0-9._ -]+")
+
+
+class BodyError(Exception):
+    """The request body was refused; carries the status to answer with."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def parse_urlencoded(text: str) -> Dict[str, str]:
+    """Parse application/x-www-form-urlencoded text.
+
+    Empty parameters are skipped and a parameter without '=' gets an empty value.
+    """
+    fields = {}
+    for parameter in text.split("&"):
+        if not parameter:
+            continue
+        key, _, value = parameter.partition("=")
+        fields[unquote_plus(key)] = unquote_plus(value)
+    return fields
+
+
+def parse_header_params(value: str) -> Tuple[str, Dict[str, str]]:
+    """Split a header like 'form-data; name="x"' into its main value and parameters."""
+    main, _, rest = value.partition(";")
+    params = {}
+    for match in PARAM_RE.finditer(";" + rest):
+        param = match.group(2).strip()
+        if param.startswith('"') and param.endswith('"') and len(param) >= 2:
+            param = re.sub(r'\\(.)', r'\1', param[1:-1])
+        params[match.group(1).lower()] = param
+    return main.strip().lower(), params
+
+
+def safe_filename(filename: str) -> str:
+    """Reduce a client-supplied file name to a plain name that is safe to create."""
+    name = filename.replace("\\", "/").rsplit("/", 1)[-1]
+    name = UNSAFE_FILENAME_RE.sub("_", name).strip(" .")
+    return name[:200] or "upload"
+
+
+class Upload:
+    """A file part of a multipart body, spooled to a hidden temporary file."""
+
+    __slots__ = ('field', 'filename', 'content_type', 'path', 'size', 'committed')
+
+    def __init__(self, field: str, filename: str, content_type: str, path: str):
+        """
+        Args:
+            field: Form field the file was sent in
+            filename: File name the client gave
+            content_type: Content-Type of the part
+            path: Temporary file holding the data
+        """
+        self.field = field
+        self.filename = filename
+        self.content_type = content_type
+        self.path = path
+        self.size = 0
+        self.committed = False
+
+    def commit(self, directory: str, name: Optional[str] = None) -> str:
+        """Move the file into directory under a safe, unused name.
+
+        Args:
+            directory: Where to put the file
+            name: Name to save under; defaults to the client's file name
+
+        Returns:
+            Path of the saved file
+        """
+        stem, extension = os.path.splitext(safe_filename(name or self.filename))
+        number = 0
+        while True:
+            target = os.path.join(directory, f"{stem}-{number}{extension}" if number else stem + extension)
+            try:
+                # Linking fails instead of replacing if the name is taken
+                os.link(self.path, target)
+                break
+            except FileExistsError:
+                number += 1
+        os.remove(self.path)
+        # mkstemp creates the file private to us; saved files are served to everyone
+        os.chmod(target, 0o644)
+        self.path = target
+        self.committed = True
+        return target
+
+    def discard(self) -> None:
+        """Delete the temporary file unless it was committed."""
+        if not self.committed:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class Body:
+    """A parsed request body: form fields, uploaded files and, unless multipart, the raw bytes."""
+
+    def __init__(self, content_type: str, raw: Optional[bytes] = None,
+                 fields: Optional[Dict[str, str]] = None, uploads: Optional[List[Upload]] = None):
+        """
+        Args:
+            content_type: Media type of the body, lower-cased, without parameters
+            raw: The body as received (None for multipart bodies)
+            fields: Form fields, for multipart bodies
+            uploads: File parts, for multipart bodies
+        """
+        self.content_type = content_type
+        self.raw = raw
+        self._fields = fields
+        self.uploads = uploads or []
+
+    @property
+    def fields(self) -> Dict[str, str]:
+        """Form fields; any non-multipart body is read as urlencoded."""
+        if self._fields is None:
+            self._fields = parse_urlencoded(self.text())
+        return self._fields
+
+    def text(self) -> str:
+        """The raw body decoded as UTF-8 (empty for multipart bodies)."""
+        return (self.raw or b"").decode("utf-8", "replace")
+
+    def discard(self) -> None:
+        """Delete every upload that was not committed."""
+        for upload in self.uploads:
+            upload.discard()
+
+    def __str__(self) -> str:
+        if self.raw is not None:
+            if len(self.raw) <= LOG_BODY_CHARS:
+                return self.text()
+            # Bulk bodies such as event imports are summarised rather than logged whole
+            return f"{self.raw[:LOG_BODY_CHARS].decode('utf-8', 'replace')}... ({len(self.raw)} bytes)"
+        # Multipart: the fields, then the files by name and size rather than content
+        fields = "&".join(f"{key}={value}" for key, value in self.fields.items())
+        files = ", ".join(f"{upload.filename} ({upload.size} bytes)" for upload in self.uploads)
+        return f"{fields} [{files}]"
+
+
+class BodyParser:
+    """Consumes a body a chunk at a time; finish() returns the Body."""
+
+    # Whether feed() does disk I/O, so async servers should run it off the event loop
+    blocking = False
+
+    def __init__(self, content_type: str, length: int):
+        self.content_type = content_type
+        self.length = length
+
+    def feed(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def finish(self) -> Body:
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        """Throw away anything written so far."""
+
+
+class RawParser(BodyParser):
+    """Collects a body in memory; its size was checked against the limit up front."""
+
+    def __init__(self, content_type: str, length: int):
+        super().__init__(content_type, length)
+        self._data = bytearray()
+
+    def feed(self, data: bytes) -> None:
+        self._data += data
+
+    def finish(self) -> Body:
+        return Body(self.content_type, raw=bytes(self._data))
+
+
+class MultipartParser(BodyParser):
+    """Streams a multipart/form-data body, writing file parts straight to disk.
+
+    Only the boundary-sized tail of the stream is ever held back, so memory
+    use is bounded by the chunk size however large the files are. Ordinary
+    fields are kept in memory, up to max_field_bytes in total.
+    """
+
+    blocking = True
+
+    _PREAMBLE, _AFTER_BOUNDARY, _HEADERS, _DATA, _DONE = range(5)
+
+    def __init__(self, content_type: str, length: int, boundary: str, upload_dir: str,
+                 max_field_bytes: int):
+        """
+        Args:
+            content_type: Media type of the body
+            length: Content-Length of the body
+            boundary: Boundary parameter of the Content-Type
+            upload_dir: Directory for the temporary files; commit() moves
+                them from here, so it should be on the same filesystem
+            max_field_bytes: Total size allowed for non-file fields
+        """
+        super().__init__(content_type, length)
+        self.upload_dir = upload_dir
+        self.max_field_bytes = max_field_bytes
+        self._dash_boundary = b"--" + boundary.encode("latin-1")
+        self._delimiter = b"\r\n" + self._dash_boundary
+        self._buffer = bytearray()
+        self._state = self._PREAMBLE
+        self._fields: Dict[str, str] = {}
+        self._field_bytes = 0
+        self._uploads: List[Upload] = []
+        # The part being read: (field name, open file or None, field value)
+        self._part: Optional[Tuple[str, Optional[object], bytearray]] = None
+
+    def feed(self, data: bytes) -> None:
+        buffer = self._buffer
+        buffer += data
+        while True:
+            if self._state == self._PREAMBLE:
+                index = buffer.find(self._dash_boundary)
+                if index < 0:
+                    del buffer[:max(len(buffer) - len(self._dash_boundary) + 1, 0)]
+                    return
+                del buffer[:index + len(self._dash_boundary)]
+                self._state = self._AFTER_BOUNDARY
+            elif self._state == self._AFTER_BOUNDARY:
+                if len(buffer) < 2:
+                    return
+                if buffer[:2] == b"--":
+                    self._state = self._DONE
+                    continue
+                if buffer[:2] != b"\r\n":
+                    raise BodyError(400, "Malformed multipart boundary")
+                del buffer[:2]
+                self._state = self._HEADERS
+            elif self._state == self._HEADERS:
+                index = buffer.find(b"\r\n\r\n")
+                if index < 0:
+                    if len(buffer) > MAX_PART_HEADERS:
+                        raise BodyError(400, "Multipart part headers too long")
+                    return
+                self._start_part(bytes(buffer[:index]))
+                del buffer[:index + 4]
+                self._state = self._DATA
+            elif self._state == self._DATA:
+                index = buffer.find(self._delimiter)
+                if index < 0:
+                    # Hold back a tail that could be the start of the delimiter
+                    keep = len(self._delimiter) - 1
+                    if len(buffer) > keep:
+                        self._part_data(buffer[:-keep])
+                        del buffer[:-keep]
+                    return
+                self._part_data(buffer[:index])
+                self._end_part()
+                del buffer[:index + len(self._delimiter)]
+                self._state = self._AFTER_BOUNDARY
+            else:
+                # The epilogue after the closing boundary is ignored
+                buffer.clear()
+                return
+
+    def _start_part(self, raw_headers: bytes) -> None:
+        headers = {}
+        for line in raw_headers.decode("utf-8", "replace").split("\r\n"):
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        disposition, params = parse_header_params(headers.get("content-disposition", ""))
+        if disposition != "form-data" or "name" not in params:
+            raise BodyError(400, "Multipart part without a form-data name")
+        filename = params.get("filename")
+        if filename:
+            os.makedirs(self.upload_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(prefix=".upload-", suffix=".part", dir=self.upload_dir)
+            upload = Upload(params["name"], filename, headers.get("content-type", "application/octet-stream"), path)
+            self._uploads.append(upload)
+            self._part = (params["name"], os.fdopen(fd, "wb"), bytearray())
+        elif filename is not None:
+            # A file input left empty: browsers still send the part, with no name
+            self._part = ("", None, bytearray())
+        else:
+            self._part = (params["name"], None, bytearray())
+
+    def _part_data(self, data: bytearray) -> None:
+        if not data:
+            return
+        name, file, value = self._part
+        if file is not None:
+            file.write(data)
+            self._uploads[-1].size += len(data)
+        elif name:
+            self._field_bytes += len(data)
+            if self._field_bytes > self.max_field_bytes:
+                raise BodyError(413, f"Form fields exceed {self.max_field_bytes} bytes")
+            value += data
+
+    def _end_part(self) -> None:
+        name, file, value = self._part
+        if file is not None:
+            file.close()
+        elif name:
+            self._fields[name] = value.decode("utf-8", "replace")
+        self._part = None
+
+    def finish(self) -> Body:
+        if self._state != self._DONE:
+            raise BodyError(400, "Multipart body ended before its closing boundary")
+        return Body(self.content_type, fields=self._fields, uploads=self._uploads)
+
+    def abort(self) -> None:
+        if self._part is not None and self._part[1] is not None:
+            self._part[1].close()
+        for upload in self._uploads:
+            upload.discard()
+
+
+def make_parser(headers: Mapping[str, str], max_body: int, max_upload: int,
+                upload_dir: str) -> Optional[BodyParser]:
+    """Pick a parser for a request body, refusing it early if it is too large.
+
+    Args:
+        headers: Request headers with lower-cased names
+        max_body: Largest body allowed, except multipart ones
+        max_upload: Largest multipart/form-data body allowed
+        upload_dir: Where multipart file parts are spooled
+
+    Returns:
+        A parser, or None if the request has no body
+
+    Raises:
+        BodyError: 400 for a malformed Content-Length or multipart boundary,
+            or one sent with Transfer-Encoding, 411 for a body framed by
+            Transfer-Encoding alone, 413 if the declared length exceeds the limit
+    """
+    # Bodies are framed by Content-Length only; one framed any other way
+    # would be read as the next request on the connection
+    if "transfer-encoding" in headers:
+        if "content-length" in headers:
+            raise BodyError(400, "Both Transfer-Encoding and Content-Length")
+        raise BodyError(411, "Transfer-Encoding is not supported; send a Content-Length")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BodyError(400, "Bad Content-Length") from None
+    if length < 0:
+        raise BodyError(400, "Bad Content-Length")
+    if not length:
+        return None
+    content_type, params = parse_header_params(headers.get("content-type", ""))
+    if content_type == "multipart/form-data":
+        if length > max_upload:
+            raise BodyError(413, f"Upload of {length} bytes exceeds the {max_upload} byte limit")
+        if not params.get("boundary"):
+            raise BodyError(400, "multipart/form-data without a boundary")
+        return MultipartParser(content_type, length, params["boundary"], upload_dir, max_body)
+    if length > max_body:
+        raise BodyError(413, f"Request body of {length} bytes exceeds the {max_body} byte limit")
+    return RawParser(content_type, length)
+
+
+def declares_body(headers: Mapping[str, str]) -> bool:
+    """Whether a request comes with a body, read or not; one left unread means closing the connection."""
+    length = headers.get("content-length", "").strip()
+    return "transfer-encoding" in headers or length not in ("", "0")
+
+
+def read_body(read: Callable[[int], bytes], parser: BodyParser) -> Body:
+    """Feed a parser from a blocking read function, BODY_CHUNK bytes at a time.
+
+    Raises:
+        BodyError: If the body is malformed or ends early; temporary files
+            are removed first
+    """
+    remaining = parser.length
+    try:
+        while remaining:
+            chunk = read(min(BODY_CHUNK, remaining))
+            if not chunk:
+                raise BodyError(400, "Request body ended early")
+            parser.feed(chunk)
+            remaining -= len(chunk)
+        return parser.finish()
+    except BaseException:
+        parser.abort()
+        raise
@@ -0,0 +1,153 @@
+"""
+Response compression and Accept-Encoding negotiation for Schedule Server
+Sebas Osorio
+"""
+
+import gzip
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Content types worth compressing; images and audio are already compressed
+COMPRESSIBLE_PREFIXES = ("text/", "application/javascript", "application/json", "application/x-ndjson")
+
+# Encodings we can produce, in order of preference
+SUPPORTED_ENCODINGS = ("br", "gzip") if brotli else ("gzip",)
+
+
+def is_compressible(content_type: str) -> bool:
+    """Check whether a response of this type should be compressed."""
+    return content_type.startswith(COMPRESSIBLE_PREFIXES)
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported encoding from an Accept-Encoding header.
+
+    Args:
+        accept_encoding: The header value, or None if it was not sent
+
+    Returns:
+        'br' or 'gzip', or None to send the body uncompressed
+    """
+    if not accept_encoding:
+        return None
+
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if coding:
+            qualities[coding] = q
+
+    best, best_q = None, 0.0
+    for coding in SUPPORTED_ENCODINGS:
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a body with the given content coding."""
+    if encoding == "br":
+        return brotli.compress(data)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a streamed body piece by piece.
+
+    Each piece is flushed as it is compressed so the client can start
+    rendering before the stream ends.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor()
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+        return
+
+    # wbits=31 selects the gzip container
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """Derive the entity tag of an encoded variant from the identity one."""
+    return etag[:-1] + "-" + encoding + '"'
+
+
+def variant_etags(etag: str) -> List[str]:
+    """Every entity tag a response may have been sent under: identity, then each encoding."""
+    return [etag] + [variant_etag(etag, encoding) for encoding in SUPPORTED_ENCODINGS]
+
+
+class VariantCache:
+    """Byte-budgeted LRU of compressed bodies keyed by (entity tag, encoding).
+
+    Entity tags change whenever content does, so entries never need
+    invalidating; outdated variants simply age out.
+    """
+
+    def __init__(self, max_bytes: int = 8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple[str, str], bytes]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, etag: str, encoding: str, body: bytes) -> bytes:
+        """Return the compressed variant of body, compressing it on first use."""
+        key = (etag, encoding)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+
+        data = compress(body, encoding)
+        if len(data) > self.max_bytes:
+            return data
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self._size += len(data)
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters that can be used to size the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,201 @@
+"""
+Concurrent HTTP server classes for Schedule Server
+Sebas Osorio
+"""
+
+import queue
+import socket
+import threading
+import time
+from http.server import HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Optional, Tuple, Type
+
+# Sent straight on the socket when the pool's queue stays full for too long
+BUSY_RESPONSE = (
+    b"HTTP/1.1 503 Service Unavailable\r\n"
+    b"Content-Length: 0\r\n"
+    b"Retry-After: 1\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+)
+
+
+class DrainMixIn:
+    """Track in-flight connections so server_close() can wait for them to finish.
+
+    The wait is bounded by drain_timeout so a stalled client cannot hold up
+    shutdown forever.
+    """
+
+    drain_timeout = 10.0
+
+    def _begin(self) -> None:
+        with self._drain_cond:
+            self._in_flight += 1
+
+    def _end(self) -> None:
+        with self._drain_cond:
+            self._in_flight -= 1
+            self._drain_cond.notify_all()
+
+    def _init_drain(self) -> None:
+        self._drain_cond = threading.Condition()
+        self._in_flight = 0
+
+    def drain(self, deadline: float) -> bool:
+        """Wait until no connection is in flight or the deadline passes.
+
+        Returns:
+            True if everything finished before the deadline
+        """
+        with self._drain_cond:
+            while self._in_flight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._drain_cond.wait(remaining)
+        return True
+
+
+class ThreadedHTTPServer(DrainMixIn, ThreadingMixIn, HTTPServer):
+    """HTTPServer that handles each connection in its own thread.
+
+    server_close() waits up to drain_timeout for in-flight requests to
+    finish before returning.
+    """
+
+    daemon_threads = True
+    block_on_close = False
+
+    def __init__(self, server_address: Tuple[str, int], handler_class: Type,
+                 drain_timeout: float = 10.0, bind_and_activate: bool = True):
+        self._init_drain()
+        self.drain_timeout = drain_timeout
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def process_request_thread(self, request, client_address):
+        self._begin()
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            self._end()
+
+    def server_close(self):
+        super().server_close()
+        self.drain(time.monotonic() + self.drain_timeout)
+
+
+class PooledHTTPServer(DrainMixIn, HTTPServer):
+    """HTTPServer that hands accepted connections to a fixed pool of worker threads.
+
+    Accepted connections wait in a bounded queue. When the queue is full the
+    accept loop blocks, which lets the kernel listen backlog absorb the burst;
+    if no slot frees up within queue_timeout the client gets a 503.
+    """
+
+    def __init__(self, server_address: Tuple[str, int], handler_class: Type,
+                 workers: int = 8, queue_size: int = 64, queue_timeout: float = 5.0,
+                 drain_timeout: float = 10.0, bind_and_activate: bool = True):
+        self._init_drain()
+        self.request_queue_size = max(queue_size, 5)
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+        self.queue_timeout = queue_timeout
+        self.drain_timeout = drain_timeout
+        self.rejected = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self._work, name=f"http-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def process_request(self, request, client_address):
+        """Queue the connection for a worker instead of handling it inline."""
+        try:
+            self._queue.put((request, client_address), timeout=self.queue_timeout)
+        except queue.Full:
+            self.rejected += 1
+            try:
+                request.sendall(BUSY_RESPONSE)
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def _work(self) -> None:
+        """Worker loop: handle queued connections until a None sentinel arrives."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            self._begin()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                self._end()
+
+    def server_close(self):
+        """Stop accepting, then let the workers drain everything already queued."""
+        super().server_close()
+        deadline = time.monotonic() + self.drain_timeout
+        try:
+            for _ in self._workers:
+                self._queue.put(None, timeout=max(deadline - time.monotonic(), 0))
+        except queue.Full:
+            return
+        for worker in self._workers:
+            worker.join(max(deadline - time.monotonic(), 0))
+
+
+def make_server(mode: str, server_address: Tuple[str, int], handler_class: Type,
+                workers: int = 8, queue_size: int = 64, queue_timeout: float = 5.0,
+                drain_timeout: float = 10.0, reuse_port: bool = False,
+                sock: Optional[socket.socket] = None) -> HTTPServer:
+    """Build the HTTP server for the configured concurrency mode.
+
+    Args:
+        mode: One of 'single', 'threaded' or 'pool'
+        server_address: (host, port) to bind
+        handler_class: Request handler class
+        workers: Number of pool threads (pool mode only)
+        queue_size: Maximum number of queued connections (pool mode only)
+        queue_timeout: Seconds to wait for a queue slot before answering 503
+        drain_timeout: Seconds server_close() waits for in-flight requests
+        reuse_port: Set SO_REUSEPORT so several processes can bind the same port
+        sock: An already listening socket to serve instead of binding a new one
+
+    Returns:
+        The bound server, ready for serve_forever()
+    """
+    if mode == 'single':
+        server = HTTPServer(server_address, handler_class, bind_and_activate=False)
+    elif mode == 'threaded':
+        server = ThreadedHTTPServer(server_address, handler_class, drain_timeout,
+                                    bind_and_activate=False)
+    elif mode == 'pool':
+        server = PooledHTTPServer(server_address, handler_class, workers, queue_size,
+                                  queue_timeout, drain_timeout, bind_and_activate=False)
+    else:
+        raise ValueError(f"Unknown SERVER_MODE '{mode}'")
+
+    try:
+        if sock is not None:
+            server.socket.close()
+            server.socket = sock
+            server.server_address = sock.getsockname()
+            server.server_name = socket.getfqdn(server.server_address[0])
+            server.server_port = server.server_address[1]
+        else:
+            if reuse_port:
+                server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            server.server_bind()
+            server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+    return server
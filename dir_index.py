@@ -0,0 +1,199 @@
+"""
+Cached directory listings for the Schedule Server file explorer
+Sebas Osorio
+"""
+
+import bisect
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Tuple
+
+# Orders a listing can be sorted in
+SORT_KEYS = ("name", "size", "mtime")
+
+
+class Entry:
+    """One file or subdirectory in a listing."""
+
+    __slots__ = ('name', 'path', 'is_dir', 'size', 'mtime', 'mime')
+
+    def __init__(self, name: str, path: str, is_dir: bool, size: int, mtime: float, mime: Optional[str]):
+        """
+        Args:
+            name: File name
+            path: Path relative to the index root, with '/' separators
+            is_dir: Whether the entry is a directory
+            size: Size in bytes (0 for directories)
+            mtime: Modification time as a Unix timestamp
+            mime: MIME type from the file extension (None for directories)
+        """
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.mime = mime
+
+
+class Listing:
+    """Entries of one directory, with sorted views built on first use."""
+
+    def __init__(self, key: Tuple[int, int], dirs: List[Entry], files: List[Entry]):
+        self.key = key
+        # Both lists are kept sorted by name, so prefixes can be bisected
+        self.dirs = sorted(dirs, key=lambda entry: entry.name)
+        self.files = sorted(files, key=lambda entry: entry.name)
+        self._dir_names = [entry.name for entry in self.dirs]
+        self._file_names = [entry.name for entry in self.files]
+        self._views: Dict[Tuple[str, bool], List[Entry]] = {}
+        self._lock = threading.Lock()
+
+    def select(self, prefix: str = "", sort: str = "name", descending: bool = False) -> List[Entry]:
+        """Entries whose name starts with prefix; directories first, each group in the given order."""
+        if not prefix:
+            view = self._views.get((sort, descending))
+            if view is None:
+                view = self._order(self.dirs, sort, descending) + self._order(self.files, sort, descending)
+                with self._lock:
+                    self._views[(sort, descending)] = view
+            return view
+        return (self._order(_with_prefix(self.dirs, self._dir_names, prefix), sort, descending)
+                + self._order(_with_prefix(self.files, self._file_names, prefix), sort, descending))
+
+    @staticmethod
+    def _order(entries: List[Entry], sort: str, descending: bool) -> List[Entry]:
+        if sort == "name":
+            return entries[::-1] if descending else entries
+        return sorted(entries, key=lambda entry: (getattr(entry, sort), entry.name), reverse=descending)
+
+
+def _with_prefix(entries: List[Entry], names: List[str], prefix: str) -> List[Entry]:
+    """Slice the name-sorted entries that start with prefix."""
+    first = bisect.bisect_left(names, prefix)
+    last = bisect.bisect_left(names, prefix + "\U0010ffff")
+    return entries[first:last]
+
+
+class DirectoryIndex:
+    """LRU of directory listings under a root, revalidated by directory mtime.
+
+    A directory's mtime changes whenever an entry is added, removed or
+    renamed, so one stat per request decides whether the cached listing is
+    still current. Sizes and mtimes of the files themselves are as of the
+    last such change.
+    """
+
+    def __init__(self, root: str, mime_types: Mapping[str, str], max_dirs: int = 256):
+        """
+        Args:
+            root: Directory the index serves; nothing outside it is listed
+            mime_types: Extension -> MIME type; files with other extensions are left out
+            max_dirs: Listings kept in memory
+        """
+        self.root = root
+        self.mime_types = mime_types
+        self.max_dirs = max_dirs
+        self._listings: "OrderedDict[str, Listing]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def resolve(self, relpath: str) -> Tuple[str, str]:
+        """Map a requested subdirectory to (normalised relative path, filesystem path).
+
+        Raises:
+            FileNotFoundError: If the path leaves the root or is not a directory
+        """
+        relpath, full, real = self._locate(relpath)
+        if not os.path.isdir(real):
+            raise FileNotFoundError(relpath)
+        return relpath, full
+
+    def resolve_file(self, relpath: str) -> str:
+        """Map a requested file under the root to its filesystem path, if listings would show it.
+
+        Raises:
+            FileNotFoundError: If the path leaves the root, is not a regular
+                file or has an extension that is not listed
+        """
+        relpath, full, real = self._locate(relpath)
+        if not relpath or self.mime_type(relpath) is None or not os.path.isfile(real):
+            raise FileNotFoundError(relpath)
+        return full
+
+    def mime_type(self, name: str) -> Optional[str]:
+        """MIME type of a file name, or None if files like it are left out of listings."""
+        return self.mime_types.get(name.rpartition(".")[2] if "." in name else "")
+
+    def _locate(self, relpath: str) -> Tuple[str, str, str]:
+        """Normalise a relative path and check that it stays inside the root, symlinks resolved.
+
+        Returns:
+            (normalised relative path, filesystem path, real path)
+        """
+        relpath = "/".join(part for part in relpath.replace("\\", "/").split("/") if part and part != ".")
+        if any(part == ".." for part in relpath.split("/")):
+            raise FileNotFoundError(relpath)
+        full = os.path.join(self.root, *relpath.split("/")) if relpath else self.root
+        real_root = os.path.realpath(self.root)
+        real = os.path.realpath(full)
+        if real != real_root and not real.startswith(real_root + os.sep):
+            raise FileNotFoundError(relpath)
+        return relpath, full, real
+
+    def listing(self, relpath: str = "") -> Listing:
+        """Return the listing of a subdirectory of the root, rescanning it if it changed.
+
+        Raises:
+            FileNotFoundError: If the path leaves the root or is not a directory
+        """
+        relpath, full = self.resolve(relpath)
+        st = os.stat(full)
+        key = (st.st_ino, st.st_mtime_ns)
+        with self._lock:
+            listing = self._listings.get(relpath)
+            if listing is not None and listing.key == key:
+                self._listings.move_to_end(relpath)
+                self.hits += 1
+                return listing
+            self.misses += 1
+
+        listing = self._scan(relpath, full, key)
+        with self._lock:
+            self._listings[relpath] = listing
+            self._listings.move_to_end(relpath)
+            while len(self._listings) > self.max_dirs:
+                self._listings.popitem(last=False)
+        return listing
+
+    def _scan(self, relpath: str, full: str, key: Tuple[int, int]) -> Listing:
+        """Read a directory into a Listing."""
+        dirs, files = [], []
+        with os.scandir(full) as entries:
+            for dirent in entries:
+                path = f"{relpath}/{dirent.name}" if relpath else dirent.name
+                try:
+                    if dirent.is_dir():
+                        dirs.append(Entry(dirent.name, path, True, 0, dirent.stat().st_mtime, None))
+                        continue
+                    mime = self.mime_type(dirent.name)
+                    if mime is None or not dirent.is_file():
+                        continue
+                    st = dirent.stat()
+                except OSError:
+                    # Removed while we were listing
+                    continue
+                files.append(Entry(dirent.name, path, False, st.st_size, st.st_mtime, mime))
+        return Listing(key, dirs, files)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'directories': len(self._listings),
+                'max_directories': self.max_dirs,
+            }
@@ -73,7 +73,83 @@ def setup_environment(env_file_path: str = '.env') -> None:
         'DEBUG': get_env('DEBUG', 'false').lower() in ('true', 'yes', '1'),
         'STATIC_DIR': get_env('STATIC_DIR', './static'),
         'FILES_DIR': get_env('FILES_DIR', './files'),
+        'MAX_BODY_BYTES': int(get_env('MAX_BODY_BYTES', 1024 * 1024)),
+        'MAX_UPLOAD_BYTES': int(get_env('MAX_UPLOAD_BYTES', 100 * 1024 * 1024)),
+        'EXPLORER_PAGE_SIZE': int(get_env('EXPLORER_PAGE_SIZE', 200)),
+        'EXPLORER_MAX_PAGE_SIZE': int(get_env('EXPLORER_MAX_PAGE_SIZE', 1000)),
+        'EXPLORER_CACHE_DIRS': int(get_env('EXPLORER_CACHE_DIRS', 256)),
         'LOG_FILE': get_env('LOG_FILE', './response.log'),
+        'LOG_QUEUE_SIZE': int(get_env('LOG_QUEUE_SIZE', 8192)),
+        'LOG_BATCH_LINES': int(get_env('LOG_BATCH_LINES', 256)),
+        'LOG_FLUSH_INTERVAL': float(get_env('LOG_FLUSH_INTERVAL', 1.0)),
+        'LOG_MAX_BYTES': int(get_env('LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        'LOG_ROTATE_INTERVAL': float(get_env('LOG_ROTATE_INTERVAL', 0.0)),
+        'LOG_BACKUPS': int(get_env('LOG_BACKUPS', 5)),
+        'LOG_COMPRESS': get_env('LOG_COMPRESS', 'true').lower() in ('true', 'yes', '1'),
+        'LOG_POLICY': get_env('LOG_POLICY', 'drop').lower(),
+        'EVENTS_FILE': get_env('EVENTS_FILE', './events.jsonl'),
+        'EVENTS_FSYNC': get_env('EVENTS_FSYNC', 'true').lower() in ('true', 'yes', '1'),
+        'EVENTS_COMMIT_DELAY': float(get_env('EVENTS_COMMIT_DELAY', 0.0)),
+        'HISTORY_PAGE_SIZE': int(get_env('HISTORY_PAGE_SIZE', 50)),
+        'HISTORY_MAX_PAGE_SIZE': int(get_env('HISTORY_MAX_PAGE_SIZE', 500)),
+        'API_CACHE_ENTRIES': int(get_env('API_CACHE_ENTRIES', 256)),
+        'IMPORT_MAX_ERRORS': int(get_env('IMPORT_MAX_ERRORS', 100)),
+        'STOCK_API_KEY': get_env('STOCK_API_KEY', 'SVWB0SITAYWCPOYL'),
+        'STOCK_API_URL': get_env('STOCK_API_URL', 'https://www.alphavantage.co/query'),
+        'QUOTE_TTL': float(get_env('QUOTE_TTL', 60.0)),
+        'QUOTE_STALE': float(get_env('QUOTE_STALE', 600.0)),
+        'QUOTE_TIMEOUT': float(get_env('QUOTE_TIMEOUT', 10.0)),
+        'QUOTE_CACHE_ENTRIES': int(get_env('QUOTE_CACHE_ENTRIES', 512)),
+        'STATIC_CACHE_BYTES': int(get_env('STATIC_CACHE_BYTES', 16 * 1024 * 1024)),
+        'IMAGE_CACHE_DIR': get_env('IMAGE_CACHE_DIR', './image_cache'),
+        'IMAGE_CACHE_BYTES': int(get_env('IMAGE_CACHE_BYTES', 64 * 1024 * 1024)),
+        'IMAGE_WIDTHS': tuple(sorted(int(width) for width in get_env('IMAGE_WIDTHS', '160,320,480,640').split(',') if width.strip())),
+        'IMAGE_QUALITY': int(get_env('IMAGE_QUALITY', 75)),
+        'ASSET_FINGERPRINT': get_env('ASSET_FINGERPRINT', 'true').lower() in ('true', 'yes', '1'),
+        'ASSET_MINIFY': get_env('ASSET_MINIFY', 'true').lower() in ('true', 'yes', '1'),
+        'ASSET_BUNDLE': get_env('ASSET_BUNDLE', 'false').lower() in ('true', 'yes', '1'),
+        'COMPRESS_MIN_BYTES': int(get_env('COMPRESS_MIN_BYTES', 1024)),
+        'COMPRESS_CACHE_BYTES': int(get_env('COMPRESS_CACHE_BYTES', 8 * 1024 * 1024)),
+        'RATE_LIMIT_STATIC_RPS': float(get_env('RATE_LIMIT_STATIC_RPS', 50.0)),
+        'RATE_LIMIT_STATIC_BURST': float(get_env('RATE_LIMIT_STATIC_BURST', 200.0)),
+        'RATE_LIMIT_DYNAMIC_RPS': float(get_env('RATE_LIMIT_DYNAMIC_RPS', 5.0)),
+        'RATE_LIMIT_DYNAMIC_BURST': float(get_env('RATE_LIMIT_DYNAMIC_BURST', 20.0)),
+        'MAX_IN_FLIGHT_STATIC': int(get_env('MAX_IN_FLIGHT_STATIC', 64)),
+        'MAX_IN_FLIGHT_DYNAMIC': int(get_env('MAX_IN_FLIGHT_DYNAMIC', 8)),
+        'ADMISSION_QUEUE_SIZE': int(get_env('ADMISSION_QUEUE_SIZE', 16)),
+        'ADMISSION_QUEUE_TIMEOUT': float(get_env('ADMISSION_QUEUE_TIMEOUT', 0.1)),
+        'ADMISSION_DYNAMIC_ROUTES': frozenset(name.strip() for name in get_env(
+            'ADMISSION_DYNAMIC_ROUTES',
+            'event_log,submission_history,explorer,upload,api_events,api_import,api_conflicts,api_quote').split(',')),
+        'RETRY_AFTER': int(get_env('RETRY_AFTER', 1)),
+        'PROFILE_ENABLED': get_env('PROFILE_ENABLED', get_env('DEBUG', 'false')).lower() in ('true', 'yes', '1'),
+        'PROFILE_SAMPLE_RATE': float(get_env('PROFILE_SAMPLE_RATE', 0.01)),
+        'PROFILE_DIR': get_env('PROFILE_DIR', './profiles'),
+        'SLOW_REQUEST_MS': float(get_env('SLOW_REQUEST_MS', 500.0)),
+        'SLOW_REQUEST_TRACES': int(get_env('SLOW_REQUEST_TRACES', 100)),
+        'ADMIN_TOKEN': get_env('ADMIN_TOKEN', ''),
+        'SERVER_MODE': get_env('SERVER_MODE', 'single').lower(),
+        'WORKERS': int(get_env('WORKERS', 8)),
+        'PROCESSES': int(get_env('PROCESSES', 1)),
+        'QUEUE_SIZE': int(get_env('QUEUE_SIZE', 64)),
+        'QUEUE_TIMEOUT': float(get_env('QUEUE_TIMEOUT', 5.0)),
+        'DRAIN_TIMEOUT': float(get_env('DRAIN_TIMEOUT', 10.0)),
+        'KEEPALIVE_TIMEOUT': float(get_env('KEEPALIVE_TIMEOUT', 5.0)),
+        'KEEPALIVE_MAX_REQUESTS': int(get_env('KEEPALIVE_MAX_REQUESTS', 100)),
+    }
+    
+    # Cache-Control policy for each static content folder
+    cache_control_defaults = {
+        'html': 'no-cache',
+        'css': 'public, max-age=3600',
+        'js': 'public, max-age=3600',
+        'img': 'public, max-age=86400',
+        'audio': 'public, max-age=86400',
+        'text': 'no-cache',
+    }
+    config['CACHE_CONTROL'] = {
+        folder: get_env(f'CACHE_CONTROL_{folder.upper()}', default)
+        for folder, default in cache_control_defaults.items()
     }
     
     return config
@@ -0,0 +1,153 @@
+"""
+JSON event query API for Schedule Server
+Sebas Osorio
+"""
+
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from event_store import Event, parse_time
+
+# Query parameters /api/events understands
+FILTER_PARAMS = ("dayofweek", "start", "end", "location", "q", "offset", "limit")
+
+# Matches serialised into each piece of an NDJSON export
+NDJSON_BATCH = 512
+
+Match = Tuple[int, Event]
+
+
+def parse_filters(query_string: Optional[str]) -> Dict[str, Any]:
+    """Turn the query string of an /api/events request into query filters.
+
+    Args:
+        query_string: Query string from the URL
+
+    Returns:
+        Keyword arguments for EventStore.query_ids(), plus 'offset' and 'limit'
+
+    Raises:
+        ValueError: If a time, offset or limit is malformed
+    """
+    params = {key: values[0] for key, values in parse_qs(query_string or "").items()
+              if key in FILTER_PARAMS}
+    filters: Dict[str, Any] = {
+        'dayofweek': params.get("dayofweek"),
+        'location': params.get("location"),
+        'text': params.get("q"),
+        'start_from': None,
+        'end_until': None,
+        'offset': 0,
+        'limit': None,
+    }
+    if "start" in params:
+        filters['start_from'] = parse_time(params["start"])
+        if filters['start_from'] is None:
+            raise ValueError(f"start must be a time as HH:MM, not {params['start']!r}")
+    if "end" in params:
+        filters['end_until'] = parse_time(params["end"])
+        if filters['end_until'] is None:
+            raise ValueError(f"end must be a time as HH:MM, not {params['end']!r}")
+    for name in ("offset", "limit"):
+        if name in params:
+            try:
+                filters[name] = int(params[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an integer, not {params[name]!r}") from None
+            if filters[name] < 0:
+                raise ValueError(f"{name} must not be negative")
+    return filters
+
+
+def cache_key(filters: Dict[str, Any]) -> str:
+    """Canonical form of a set of filters, for result caching and entity tags."""
+    return json.dumps(filters, sort_keys=True, separators=(",", ":"))
+
+
+def as_record(match: Match) -> Dict[str, Any]:
+    """The JSON representation of one matching event."""
+    event_id, event = match
+    record = {"id": event_id}
+    record.update(event)
+    return record
+
+
+def render_json(version: str, total: int, matches: List[Match]) -> bytes:
+    """Serialise one page of query results as a JSON document."""
+    return json.dumps({
+        "version": version,
+        "total": total,
+        "count": len(matches),
+        "events": [as_record(match) for match in matches],
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def render_conflicts(version: str, pairs: List[Tuple[Match, Match]]) -> bytes:
+    """Serialise overlapping event pairs as a JSON document."""
+    return json.dumps({
+        "version": version,
+        "count": len(pairs),
+        "conflicts": [
+            {"dayofweek": first[1].get("dayofweek", ""), "events": [as_record(first), as_record(second)]}
+            for first, second in pairs
+        ],
+    }, separators=(",", ":")).encode("utf-8")
+
+
+def iter_ndjson(matches: List[Match]) -> Iterator[bytes]:
+    """Serialise query results as newline-delimited JSON, a batch at a time."""
+    for start in range(0, len(matches), NDJSON_BATCH):
+        yield "".join(
+            json.dumps(as_record(match), separators=(",", ":")) + "\n"
+            for match in matches[start:start + NDJSON_BATCH]).encode("utf-8")
+
+
+class ResultCache:
+    """LRU of serialised query results keyed by (store version, filters).
+
+    The store version changes whenever an event is added, so stale results
+    are never served; they just age out. Dashboards polling the same query
+    are answered without touching the indexes or the JSON encoder.
+    """
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: str, key: str) -> Optional[bytes]:
+        """Return a cached result, or None."""
+        with self._lock:
+            data = self._entries.get((version, key))
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((version, key))
+            self.hits += 1
+            return data
+
+    def put(self, version: str, key: str, data: bytes) -> None:
+        """Remember a result, evicting the least recently used if full."""
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(version, key)] = data
+            self._entries.move_to_end((version, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
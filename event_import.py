@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Bulk event import for Schedule Server
+Sebas Osorio
+
+Events are read from JSON lines (one object per line) or CSV (a header row
+naming the columns), validated in a single streaming pass, and stored with
+one EventStore.add_many() call, so a whole file costs one write and one
+fsync. Records that fail validation are skipped and reported by line.
+
+As a command, sends a file to a running server's /api/events/import, or
+with --events-file writes straight into an event store file:
+
+    python event_import.py semester.csv [--url http://localhost:8045/api/events/import]
+    python event_import.py semester.jsonl --events-file ./events.jsonl [--strict] [--dry-run]
+"""
+
+import argparse
+import codecs
+import csv
+import json
+import os
+import sys
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+from env_config import get_env
+from event_store import EVENT_FIELDS, Event, EventStore, make_record, parse_time
+
+# Import formats by request Content-Type and by file extension
+FORMAT_TYPES = {
+    "application/x-ndjson": "jsonl",
+    "application/jsonl": "jsonl",
+    "application/json-lines": "jsonl",
+    "text/csv": "csv",
+}
+FORMAT_EXTENSIONS = {".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv"}
+CONTENT_TYPES = {"jsonl": "application/x-ndjson", "csv": "text/csv"}
+
+# Values accepted for dayofweek: the form's, plus the usual 'Thu'
+DAYS = ("Sun", "Mon", "Tue", "Wed", "Thu", "Thur", "Fri", "Sat")
+
+# Fields a record must have
+REQUIRED_FIELDS = ("eventname", "dayofweek")
+
+# Longest value accepted for any field
+MAX_FIELD_LENGTH = 1000
+
+# Per-record errors included in a summary; the rest are only counted
+MAX_ERRORS = 100
+
+
+def detect_format(content_type: str = "", filename: str = "") -> Optional[str]:
+    """Name the import format of a body or file, or None if it is neither JSONL nor CSV."""
+    media_type = content_type.partition(";")[0].strip().lower()
+    if media_type in FORMAT_TYPES:
+        return FORMAT_TYPES[media_type]
+    return FORMAT_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def validate(record: Any) -> Event:
+    """Check one decoded record and turn it into a stored event.
+
+    Raises:
+        ValueError: Describing the first problem found
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    unknown = [key for key in record if key not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown field {unknown[0]!r}")
+    fields = {}
+    for key, value in record.items():
+        if value is None:
+            value = ""
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        elif not isinstance(value, str):
+            raise ValueError(f"{key} must be a string")
+        if len(value) > MAX_FIELD_LENGTH:
+            raise ValueError(f"{key} is longer than {MAX_FIELD_LENGTH} characters")
+        fields[key] = value.strip()
+    for key in REQUIRED_FIELDS:
+        if not fields.get(key):
+            raise ValueError(f"{key} is required")
+    if fields["dayofweek"] not in DAYS:
+        raise ValueError(f"dayofweek must be one of {', '.join(DAYS)}, not {fields['dayofweek']!r}")
+    for key in ("starttime", "endtime"):
+        if fields.get(key) and parse_time(fields[key]) is None:
+            raise ValueError(f"{key} must be a time as HH:MM, not {fields[key]!r}")
+    return make_record(fields)
+
+
+def read_jsonl(lines: Iterable[bytes]) -> Iterator[Tuple[int, Any]]:
+    """Decode JSON lines, skipping blank ones.
+
+    Yields:
+        (line number, decoded value), with a ValueError in place of the
+        value for a line that is not valid JSON
+    """
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, ValueError(f"invalid JSON: {e}")
+
+
+def read_csv(lines: Iterable[bytes]) -> Iterator[Tuple[int, Any]]:
+    """Decode CSV rows into records keyed by the header row; empty cells are left out.
+
+    Yields:
+        (line number, record); quoted cells may span lines, and the number
+        is the line the row ends on
+
+    Raises:
+        ValueError: If the header row is missing or names an unknown column
+    """
+    reader = csv.reader(codecs.iterdecode(lines, "utf-8-sig", errors="replace"))
+    header = next(reader, None)
+    if not header:
+        raise ValueError("CSV input has no header row")
+    columns = [name.strip().lower() for name in header]
+    unknown = [name for name in columns if name not in EVENT_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown CSV column {unknown[0]!r}; columns are {', '.join(EVENT_FIELDS)}")
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) > len(columns):
+            yield reader.line_num, ValueError(f"{len(row)} cells for {len(columns)} columns")
+            continue
+        yield reader.line_num, {name: cell for name, cell in zip(columns, row) if cell}
+
+
+READERS = {"jsonl": read_jsonl, "csv": read_csv}
+
+
+class ImportResult:
+    """Outcome of an import: counts and the first MAX_ERRORS per-record errors."""
+
+    def __init__(self, max_errors: int = MAX_ERRORS):
+        """
+        Args:
+            max_errors: Errors kept for the summary
+        """
+        self.max_errors = max_errors
+        self.accepted = 0
+        self.rejected = 0
+        self.stored = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def reject(self, line: int, message: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "error": message})
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "stored": self.stored,
+            "errors": self.errors,
+            "errors_truncated": self.rejected > len(self.errors),
+        }
+
+
+def import_events(store: EventStore, lines: Iterable[bytes], fmt: str, strict: bool = False,
+                  dry_run: bool = False, max_errors: int = MAX_ERRORS) -> ImportResult:
+    """Validate records as they are read, then store the valid ones in one batch.
+
+    Args:
+        store: Event store to add the events to
+        lines: The input, a line of bytes at a time
+        fmt: 'jsonl' or 'csv'
+        strict: Store nothing if any record is rejected
+        dry_run: Only validate
+        max_errors: Per-record errors kept for the summary
+
+    Returns:
+        Counts of accepted, rejected and stored records, with their errors
+
+    Raises:
+        ValueError: If the input as a whole is unreadable (a bad CSV header)
+        StoreError: If the batch could not be written
+    """
+    result = ImportResult(max_errors)
+    events = []
+    for line, record in READERS[fmt](lines):
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            events.append(validate(record))
+        except ValueError as e:
+            result.reject(line, str(e))
+    result.accepted = len(events)
+    if events and not dry_run and not (strict and result.rejected):
+        store.add_many(events)
+        result.stored = len(events)
+    return result
+
+
+def post_file(url: str, path: str, fmt: str, params: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+    """Upload a file to an import endpoint as multipart/form-data, streaming it from disk.
+
+    Returns:
+        (HTTP status, decoded JSON summary)
+    """
+    boundary = uuid.uuid4().hex
+    head = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+            f'filename="{os.path.basename(path)}"\r\nContent-Type: {CONTENT_TYPES[fmt]}\r\n\r\n').encode("utf-8")
+    tail = f"\r\n--{boundary}--\r\n".encode("ascii")
+
+    def parts() -> Iterator[bytes]:
+        yield head
+        with open(path, "rb") as f:
+            yield from iter(lambda: f.read(64 * 1024), b"")
+        yield tail
+
+    request = Request(f"{url}?{urlencode(params)}" if params else url, data=parts(), method="POST", headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(len(head) + os.path.getsize(path) + len(tail)),
+    })
+    try:
+        with urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        body = e.read()
+        try:
+            return e.code, json.loads(body)
+        except ValueError:
+            return e.code, {"error": body.decode("utf-8", "replace").strip()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Import events from a JSONL or CSV file.")
+    parser.add_argument("file", help="events as JSON lines (.jsonl, .ndjson) or CSV (.csv)")
+    parser.add_argument("--format", choices=sorted(READERS), help="input format (default: from the extension)")
+    parser.add_argument("--url", help="import endpoint of a running server "
+                                      "(default: http://HOST:PORT/api/events/import from the environment)")
+    parser.add_argument("--events-file", help="write into this event store file instead of a server")
+    parser.add_argument("--strict", action="store_true", help="store nothing if any record is rejected")
+    parser.add_argument("--dry-run", action="store_true", help="validate only")
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(filename=args.file)
+    if fmt is None:
+        parser.error(f"cannot tell the format of {args.file}; pass --format")
+
+    if args.events_file:
+        try:
+            with open(args.file, "rb") as f:
+                summary = import_events(EventStore(args.events_file), f, fmt,
+                                        strict=args.strict, dry_run=args.dry_run).to_json()
+        except ValueError as e:
+            summary = {"error": str(e)}
+        status = 400 if "error" in summary else 200
+    else:
+        url = args.url
+        if url is None:
+            url = f"http://{get_env('HOST', 'localhost')}:{get_env('PORT', 8045)}/api/events/import"
+        params = {name: "1" for name in ("strict", "dry_run") if getattr(args, name)}
+        try:
+            status, summary = post_file(url, args.file, fmt, params)
+        except URLError as e:
+            print(f"Cannot reach {url}: {e.reason}", file=sys.stderr)
+            return 1
+
+    json.dump(summary, sys.stdout, indent=2)
+    print()
+    return 0 if status == 200 and not summary.get("rejected") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
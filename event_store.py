@@ -0,0 +1,504 @@
+"""
+Persistent, indexed event storage for Schedule Server
+Sebas Osorio
+"""
+
+import bisect
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from intervals import IntervalIndex, overlapping_pairs
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; a single process needs no file locking
+    fcntl = None
+
+logger = logging.getLogger('personal_website')
+
+# Form fields that make up an event record, in table column order
+EVENT_FIELDS = (
+    "eventname", "dayofweek", "starttime", "endtime",
+    "phonenumber", "location", "extrainfo", "url",
+)
+
+# Sort key for events whose start time is missing or unparseable
+NO_TIME = 24 * 60
+
+# Fields covered by the free-text word index
+TEXT_FIELDS = ("eventname", "extrainfo")
+
+WORD_RE = re.compile(r"\w+")
+
+Event = Dict[str, str]
+
+
+class StoreError(Exception):
+    """Raised when a batch of events could not be made durable."""
+
+
+def parse_time(value: Optional[str]) -> Optional[int]:
+    """Convert an 'HH:MM' time into minutes after midnight, or None if invalid."""
+    if not value:
+        return None
+    hours, sep, minutes = value.partition(":")
+    if not sep:
+        return None
+    try:
+        total = int(hours) * 60 + int(minutes[:2])
+    except ValueError:
+        return None
+    return total if 0 <= total < 24 * 60 else None
+
+
+def make_record(form: Dict[str, str]) -> Event:
+    """Build a structured event record from submitted form fields."""
+    return {field: form.get(field, "") for field in EVENT_FIELDS}
+
+
+def words(text: str) -> List[str]:
+    """Split text into the lower-cased words the free-text index is built from."""
+    return WORD_RE.findall(text.lower())
+
+
+class EventStore:
+    """Append-only JSON-lines log of events with in-memory indexes.
+
+    Every process that opens the same file sees the same events: writers
+    append under an exclusive flock, and readers pick up lines written by
+    other processes by reading on from the last offset they consumed.
+
+    Writes use group commit. Concurrent add() calls queue their records and
+    whichever caller gets there first writes and fsyncs the whole batch for
+    everyone, so a burst of submissions costs one fsync rather than one each.
+
+    Events are indexed by day of week (and within each day kept sorted by
+    start time), by location, and by the words of their name and extra info,
+    so filtered lookups never scan the whole log. Each day also has an
+    interval index of start-end spans for conflict detection.
+    """
+
+    def __init__(self, path: str, fsync: bool = True, commit_delay: float = 0.0):
+        """
+        Args:
+            path: Location of the log file; created on first write
+            fsync: Whether each committed batch is fsync'ed before add() returns
+            commit_delay: Seconds a committing writer waits for others to join
+                its batch
+        """
+        self.path = path
+        self.fsync = fsync
+        self.commit_delay = commit_delay
+
+        self._lock = threading.Lock()
+        self._events: List[Event] = []
+        self._by_day: Dict[str, List[Tuple[int, int]]] = {}
+        self._by_location: Dict[str, List[int]] = {}
+        self._by_word: Dict[str, List[int]] = {}
+        self._vocabulary: List[str] = []
+        self._intervals: Dict[str, IntervalIndex] = {}
+        self._starts: List[int] = []
+        self._ends: List[Optional[int]] = []
+        self._offset = 0
+
+        self._commit_cond = threading.Condition()
+        self._pending: List[bytes] = []
+        self._enqueued = 0
+        self._committed = 0
+        self._committing = False
+        self._failed: Tuple[int, Optional[BaseException]] = (0, None)
+
+        self.commits = 0
+        self.appended = 0
+        self.corrupt_lines = 0
+
+        self._recover()
+
+    # Writing
+
+    def add(self, event: Event) -> None:
+        """Durably append one event."""
+        self.add_many([event])
+
+    def add_many(self, events: Iterable[Event]) -> None:
+        """Durably append several events in one batch.
+
+        Raises:
+            StoreError: If the batch could not be written
+        """
+        data = b"".join(
+            (json.dumps(event, separators=(",", ":")) + "\n").encode("utf-8") for event in events)
+        if not data:
+            return
+
+        with self._commit_cond:
+            self._pending.append(data)
+            self._enqueued += 1
+            ticket = self._enqueued
+            while self._committed < ticket:
+                failed_through, error = self._failed
+                if ticket <= failed_through:
+                    raise StoreError(f"Could not write events to {self.path}") from error
+                if self._committing:
+                    self._commit_cond.wait()
+                    continue
+                self._lead_commit()
+
+    def _lead_commit(self) -> None:
+        """Write out every pending batch; called with _commit_cond held."""
+        self._committing = True
+        self._commit_cond.release()
+        try:
+            if self.commit_delay:
+                time.sleep(self.commit_delay)
+            with self._commit_cond:
+                batch, self._pending = self._pending, []
+                last = self._enqueued
+            try:
+                self._write(b"".join(batch))
+            except BaseException as e:
+                # Every writer in the batch has to hear of it, or it would
+                # take the batch as committed and its events would be lost
+                logger.error(f"Event store write failed: {e!r}")
+                with self._commit_cond:
+                    self._failed = (last, e)
+                if isinstance(e, OSError):
+                    return
+                raise
+            with self._commit_cond:
+                self._committed = last
+                self.commits += 1
+                self.appended += sum(chunk.count(b"\n") for chunk in batch)
+        finally:
+            self._commit_cond.acquire()
+            self._committing = False
+            self._commit_cond.notify_all()
+
+    def _write(self, data: bytes) -> None:
+        """Append data to the log under an exclusive lock."""
+        with open(self.path, "ab") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(data)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    # Reading
+
+    def events(self) -> List[Event]:
+        """Return every event in submission order, including other processes' writes."""
+        with self._lock:
+            self._refresh()
+            return list(self._events)
+
+    def slice(self, start: int, stop: int) -> List[Event]:
+        """Return events start..stop-1 in submission order."""
+        with self._lock:
+            self._refresh()
+            return self._events[start:stop]
+
+    def iter_batches(self, batch_size: int = 256) -> Iterator[List[Event]]:
+        """Yield every event in submission order, a batch at a time.
+
+        Only one batch is copied at a time, so callers that stream the
+        events out never hold a second copy of the whole history.
+        """
+        with self._lock:
+            self._refresh()
+            total = len(self._events)
+        for start in range(0, total, batch_size):
+            with self._lock:
+                batch = self._events[start:min(start + batch_size, total)]
+            yield batch
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._events)
+
+    def query(self, dayofweek: Optional[str] = None, start_from: Optional[int] = None,
+              start_until: Optional[int] = None, end_until: Optional[int] = None,
+              location: Optional[str] = None, text: Optional[str] = None) -> List[Event]:
+        """Look up events through the indexes; see query_ids() for the arguments.
+
+        Returns:
+            Matching events
+        """
+        with self._lock:
+            self._refresh()
+            ids = self._select(dayofweek, start_from, start_until, end_until, location, text)
+            return [self._events[event_id] for event_id in ids]
+
+    def query_ids(self, dayofweek: Optional[str] = None, start_from: Optional[int] = None,
+                  start_until: Optional[int] = None, end_until: Optional[int] = None,
+                  location: Optional[str] = None, text: Optional[str] = None) -> List[Tuple[int, Event]]:
+        """Look up events through the day/start-time, location and word indexes.
+
+        Args:
+            dayofweek: Only events on this day ('Mon', 'Tue', ...)
+            start_from: Only events starting at or after this many minutes past midnight
+            start_until: Only events starting at or before this many minutes past midnight
+            end_until: Only events ending at or before this many minutes past midnight
+            location: Only events at this location (case-insensitive)
+            text: Only events whose name or extra info contains every word of
+                this text, matching words by prefix (case-insensitive); text
+                without any words matches nothing
+
+        Returns:
+            (event id, event) pairs, ordered by day then start time when a day
+            or start time filter is given and in submission order otherwise
+        """
+        with self._lock:
+            self._refresh()
+            ids = self._select(dayofweek, start_from, start_until, end_until, location, text)
+            return [(event_id, self._events[event_id]) for event_id in ids]
+
+    def _select(self, dayofweek: Optional[str], start_from: Optional[int], start_until: Optional[int],
+                end_until: Optional[int], location: Optional[str], text: Optional[str]) -> List[int]:
+        """Resolve filters to event ids; called with _lock held."""
+        # Intersect the location and word postings, smallest first
+        postings: List[Iterable[int]] = []
+        if location is not None:
+            postings.append(self._by_location.get(location.strip().lower(), ()))
+        if text is not None:
+            terms = words(text)
+            if not terms:
+                return []
+            for word in terms:
+                postings.append(self._word_postings(word))
+        allowed: Optional[Set[int]] = None
+        for ids in sorted(postings, key=len):
+            allowed = set(ids) if allowed is None else allowed.intersection(ids)
+            if not allowed:
+                return []
+
+        if dayofweek is None and start_from is None and start_until is None:
+            if allowed is None:
+                selected: Iterable[int] = range(len(self._events))
+            else:
+                selected = sorted(allowed)
+        else:
+            days = [dayofweek] if dayofweek is not None else list(self._by_day)
+            lowest = start_from if start_from is not None else -1
+            highest = start_until if start_until is not None else NO_TIME
+            if start_from is not None or start_until is not None:
+                # Events without a usable start time never match a time window
+                highest = min(highest, NO_TIME - 1)
+            low, high = (lowest, -1), (highest, sys.maxsize)
+
+            ranges = []
+            for day in days:
+                entries = self._by_day.get(day, [])
+                ranges.append((entries, bisect.bisect_left(entries, low), bisect.bisect_right(entries, high)))
+
+            if allowed is not None and len(allowed) < sum(last - first for _, first, last in ranges):
+                # Fewer candidates than index entries: check the candidates instead
+                order = {day: position for position, day in enumerate(days)}
+                keyed = []
+                for event_id in allowed:
+                    position = order.get(self._events[event_id].get("dayofweek", ""))
+                    start = self._starts[event_id]
+                    if position is not None and lowest <= start <= highest:
+                        keyed.append((position, start, event_id))
+                keyed.sort()
+                selected = [event_id for _, _, event_id in keyed]
+            else:
+                selected = []
+                for entries, first, last in ranges:
+                    selected.extend(event_id for _, event_id in entries[first:last]
+                                    if allowed is None or event_id in allowed)
+
+        if end_until is None:
+            return list(selected)
+        return [event_id for event_id in selected
+                if self._ends[event_id] is not None and self._ends[event_id] <= end_until]
+
+    def _word_postings(self, prefix: str) -> Iterable[int]:
+        """Return the ids of events with a word starting with prefix."""
+        matches = []
+        for position in range(bisect.bisect_left(self._vocabulary, prefix), len(self._vocabulary)):
+            word = self._vocabulary[position]
+            if not word.startswith(prefix):
+                break
+            matches.append(self._by_word[word])
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def conflicts(self, event: Event) -> List[Tuple[int, Event]]:
+        """Find stored events whose time overlaps the given event's.
+
+        Events only conflict with others on the same day, and only if both
+        have a start time before their end time. Back-to-back events (one
+        ending as the next starts) do not conflict.
+
+        Returns:
+            (event id, event) pairs ordered by start time
+        """
+        start, end = parse_time(event.get("starttime")), parse_time(event.get("endtime"))
+        if start is None or end is None or start >= end:
+            return []
+        with self._lock:
+            self._refresh()
+            index = self._intervals.get(event.get("dayofweek", ""))
+            if index is None:
+                return []
+            ids = sorted(index.overlapping(start, end), key=lambda event_id: (self._starts[event_id], event_id))
+            return [(event_id, self._events[event_id]) for event_id in ids]
+
+    def conflicting_pairs(self, dayofweek: Optional[str] = None) -> List[Tuple[int, int]]:
+        """Find every pair of overlapping events with a sweep over each day.
+
+        Args:
+            dayofweek: Only look at this day
+
+        Returns:
+            (earlier id, later id) pairs, grouped by day
+        """
+        with self._lock:
+            self._refresh()
+            days = [dayofweek] if dayofweek is not None else list(self._by_day)
+            pairs = []
+            for day in days:
+                spans = [(self._starts[event_id], self._ends[event_id], event_id)
+                         for _, event_id in self._by_day.get(day, [])
+                         if self._ends[event_id] is not None and self._starts[event_id] < self._ends[event_id]]
+                pairs.extend(overlapping_pairs(spans))
+            return pairs
+
+    def event(self, event_id: int) -> Event:
+        """Return one event by id."""
+        with self._lock:
+            return self._events[event_id]
+
+    def version(self) -> str:
+        """Return a token that changes only when an event is added to the log.
+
+        It is derived from the log's inode and length, so every process
+        sharing the file computes the same value.
+        """
+        with self._lock:
+            self._refresh()
+            try:
+                inode = os.stat(self.path).st_ino
+            except FileNotFoundError:
+                inode = 0
+            return f"{inode:x}-{self._offset:x}"
+
+    def stats(self) -> Dict[str, int]:
+        """Return write-batching and recovery counters."""
+        events = len(self)
+        with self._commit_cond:
+            return {
+                'events': events,
+                'appended': self.appended,
+                'commits': self.commits,
+                'corrupt_lines': self.corrupt_lines,
+            }
+
+    # Recovery and indexing
+
+    def _recover(self) -> None:
+        """Load the log at startup, cutting off a record torn by a crash mid-write."""
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            return
+        with f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                data = f.read()
+                end = data.rfind(b"\n") + 1
+                if end < len(data):
+                    logger.error(f"Truncating {len(data) - end} bytes of a torn record in {self.path}")
+                    f.truncate(end)
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+        with self._lock:
+            self._refresh()
+        logger.info(f"Recovered {len(self._events)} events from {self.path}")
+
+    def _refresh(self) -> None:
+        """Read and index any complete lines appended since the last refresh."""
+        try:
+            size = os.stat(self.path).st_size
+        except FileNotFoundError:
+            size = 0
+        if size < self._offset:
+            # The log was truncated or replaced; start over
+            self._events = []
+            self._by_day = {}
+            self._by_location = {}
+            self._by_word = {}
+            self._vocabulary = []
+            self._intervals = {}
+            self._starts = []
+            self._ends = []
+            self._offset = 0
+        if size == self._offset:
+            return
+
+        with open(self.path, "rb") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_SH)
+            try:
+                f.seek(self._offset)
+                data = f.read()
+            finally:
+                if fcntl:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+        # Leave a partially written last line for the next refresh
+        complete = data[:data.rfind(b"\n") + 1]
+        for line in complete.splitlines():
+            if not line:
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                event = None
+            if not isinstance(event, dict):
+                # Unparseable, or valid JSON that is not an event object
+                self.corrupt_lines += 1
+                continue
+            self._index(event)
+        self._offset += len(complete)
+
+    def _index(self, event: Event) -> None:
+        """Add an event to the list and the indexes."""
+        event_id = len(self._events)
+        self._events.append(event)
+        self._ends.append(parse_time(event.get("endtime")))
+        start = parse_time(event.get("starttime"))
+        self._starts.append(start if start is not None else NO_TIME)
+        key = (self._starts[-1], event_id)
+        bisect.insort(self._by_day.setdefault(event.get("dayofweek", ""), []), key)
+        if start is not None and self._ends[-1] is not None and start < self._ends[-1]:
+            self._intervals.setdefault(event.get("dayofweek", ""), IntervalIndex()).add(
+                start, self._ends[-1], event_id)
+        self._by_location.setdefault(event.get("location", "").strip().lower(), []).append(event_id)
+
+        seen = set()
+        for field in TEXT_FIELDS:
+            for word in words(event.get(field, "")):
+                if word in seen:
+                    continue
+                seen.add(word)
+                postings = self._by_word.get(word)
+                if postings is None:
+                    postings = self._by_word[word] = []
+                    bisect.insort(self._vocabulary, word)
+                postings.append(event_id)
@@ -0,0 +1,105 @@
+"""
+HTTP caching helpers (validators and conditional GET) for Schedule Server
+Sebas Osorio
+"""
+
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Iterable, Mapping, Optional
+
+
+class Validated:
+    """A response body together with its validators and caching policy.
+
+    handle_request returns one of these instead of plain bytes when the
+    response can be revalidated with If-None-Match / If-Modified-Since.
+    """
+
+    __slots__ = ('body', 'etag', 'last_modified', 'cache_control', 'render')
+
+    def __init__(self, body: Any = None, etag: Optional[str] = None,
+                 last_modified: Optional[float] = None, cache_control: Optional[str] = None,
+                 render: Optional[Callable[[], Any]] = None):
+        """
+        Args:
+            body: Response body (str or bytes)
+            etag: Quoted entity tag, e.g. '"3f2a..."'
+            last_modified: Modification time as a Unix timestamp
+            cache_control: Value for the Cache-Control header
+            render: Builds the body instead, only once it is needed, so a
+                conditional request can be answered before doing the work
+        """
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.cache_control = cache_control
+        self.render = render
+
+    def resolve(self) -> Any:
+        """Return the body, building it with render on first use."""
+        if self.render is not None:
+            self.body, self.render = self.render(), None
+        return self.body
+
+    def headers(self) -> Mapping[str, str]:
+        """Return the caching headers that belong on both 200 and 304 responses."""
+        headers = {}
+        if self.etag:
+            headers["ETag"] = self.etag
+        if self.last_modified is not None:
+            headers["Last-Modified"] = http_date(self.last_modified)
+        if self.cache_control:
+            headers["Cache-Control"] = self.cache_control
+        return headers
+
+
+def http_date(timestamp: float) -> str:
+    """Format a Unix timestamp as an HTTP date."""
+    return formatdate(timestamp, usegmt=True)
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an entity tag."""
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def matching_etag(request_headers: Mapping[str, str], etags: Iterable[str]) -> Optional[str]:
+    """Return the first of etags that If-None-Match names, or None if it names none."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    return next((etag for etag in etags if etag_matches(if_none_match, etag)), None)
+
+
+def is_not_modified(request_headers: Mapping[str, str], resource: Validated) -> bool:
+    """Decide whether a conditional GET can be answered with 304.
+
+    If-None-Match takes precedence over If-Modified-Since, as RFC 9110 requires.
+
+    Args:
+        request_headers: Request headers with lower-cased names
+        resource: The response that would otherwise be sent
+
+    Returns:
+        True if the client's copy is still current
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        return bool(resource.etag) and etag_matches(if_none_match, resource.etag)
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None and resource.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return int(resource.last_modified) <= since
+    return False
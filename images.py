@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+"""
+Resized image derivatives for Schedule Server
+Sebas Osorio
+
+Images under static/img can be requested at a smaller width (and JPEG
+quality) with ?w=320&q=70. Each derivative is generated once with Pillow,
+stored in an on-disk cache named after the source's content hash and the
+size, and evicted least recently used first when the cache outgrows its
+byte budget. Without Pillow, images are always served at full size.
+
+As a command, generates every configured width of every image ahead of time:
+
+    python images.py [--widths 160,480] [--quality 75]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only full-size images are served
+    Image = None
+
+# Pillow format names of the image types that can be resized, by extension
+IMAGE_FORMATS = {"jpg": "JPEG", "jpeg": "JPEG", "png": "PNG"}
+
+# Derivatives remembered as not worth generating, least recently asked first out
+FULL_SIZE_MEMO = 4096
+
+# Range a requested JPEG quality is clamped to
+MIN_QUALITY = 30
+MAX_QUALITY = 95
+
+
+def choose_variant(params: Mapping[str, str], widths: Sequence[int],
+                   quality: int) -> Optional[Tuple[int, int]]:
+    """Pick the derivative a request asks for.
+
+    The width is rounded up to the nearest configured one (or down to the
+    largest), so clients cannot fill the cache with arbitrary sizes.
+
+    Args:
+        params: Query parameters; w is the width in pixels, q the JPEG quality
+        widths: Configured derivative widths
+        quality: Quality used when q is not given
+
+    Returns:
+        (width, quality), or None if no width was asked for
+
+    Raises:
+        ValueError: If w or q is not a positive integer
+    """
+    if "w" not in params or not widths:
+        return None
+    try:
+        width = int(params["w"])
+        quality = int(params.get("q", quality))
+    except ValueError:
+        raise ValueError("w and q must be integers") from None
+    if width <= 0 or quality <= 0:
+        raise ValueError("w and q must be positive")
+    ordered = sorted(widths)
+    width = next((candidate for candidate in ordered if candidate >= width), ordered[-1])
+    return width, min(max(quality, MIN_QUALITY), MAX_QUALITY)
+
+
+def resize(source: str, target: str, width: int, quality: int) -> bool:
+    """Write source scaled to width into target, in the same format.
+
+    Returns:
+        False if the image is no wider than width, or scaling it did not
+        make the file smaller (which happens with photos saved as PNG)
+    """
+    fmt = IMAGE_FORMATS[source.rpartition(".")[2].lower()]
+    with Image.open(source) as image:
+        if image.width <= width:
+            return False
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        if fmt == "JPEG":
+            if resized.mode not in ("RGB", "L"):
+                resized = resized.convert("RGB")
+            resized.save(target, fmt, quality=quality, optimize=True, progressive=True)
+        else:
+            resized.save(target, fmt, optimize=True)
+    return os.path.getsize(target) < os.path.getsize(source)
+
+
+class DerivativeCache:
+    """Directory of resized images with a least-recently-used byte budget.
+
+    A derivative's file name holds the source's content hash, the width and
+    the quality, so an edited source never matches an old derivative and
+    every process sharing the directory agrees on names. Concurrent requests
+    for the same missing derivative generate it once; files are written
+    under a temporary name and renamed into place.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024):
+        """
+        Args:
+            directory: Where derivatives are stored; created with the first one
+            max_bytes: Total size of derivatives kept on disk
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        # Names being generated -> lock held by the generating thread
+        self._generating: Dict[str, threading.Lock] = {}
+        # Names of derivatives that would be no smaller than their source, in
+        # pixels or bytes, least recently asked for first
+        self._full_size: "OrderedDict[str, None]" = OrderedDict()
+
+        self.hits = 0
+        self.generated = 0
+        self.skipped = 0
+        self.evictions = 0
+
+        # Pick up derivatives from earlier runs, oldest first
+        found = []
+        for name in os.listdir(directory) if os.path.isdir(directory) else ():
+            if name.startswith("."):
+                continue
+            st = os.stat(os.path.join(directory, name))
+            found.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether derivatives can be generated (Pillow is installed)."""
+        return Image is not None
+
+    def get(self, source: str, digest: str, width: int, quality: int) -> Optional[str]:
+        """Return the path of a derivative, generating it on first use.
+
+        Args:
+            source: Path of the full-size image
+            digest: Content hash of the source
+            width: Width in pixels
+            quality: JPEG quality
+
+        Returns:
+            Path of the derivative, or None if the source is no wider than
+            width, or no larger than its derivative, and should be served as it is
+
+        Raises:
+            OSError: If the source cannot be read or the derivative written
+        """
+        stem, _, extension = os.path.basename(source).rpartition(".")
+        name = f"{stem}-{digest[:16]}-w{width}-q{quality}.{extension.lower()}"
+        path = os.path.join(self.directory, name)
+        if self._known_full_size(name):
+            return None
+        if self._lookup(name, path):
+            return path
+
+        with self._lock:
+            generating = self._generating.setdefault(name, threading.Lock())
+        with generating:
+            try:
+                if self._known_full_size(name):
+                    return None
+                if self._lookup(name, path):
+                    return path
+                os.makedirs(self.directory, exist_ok=True)
+                fd, temporary = tempfile.mkstemp(prefix=".", suffix=f".{extension}", dir=self.directory)
+                os.close(fd)
+                try:
+                    if not resize(source, temporary, width, quality):
+                        with self._lock:
+                            self.skipped += 1
+                            self._full_size[name] = None
+                            if len(self._full_size) > FULL_SIZE_MEMO:
+                                self._full_size.popitem(last=False)
+                        return None
+                    os.chmod(temporary, 0o644)
+                    os.replace(temporary, path)
+                finally:
+                    if os.path.exists(temporary):
+                        os.unlink(temporary)
+                with self._lock:
+                    self.generated += 1
+                    self._add(name, os.path.getsize(path))
+                return path
+            finally:
+                with self._lock:
+                    self._generating.pop(name, None)
+
+    def _known_full_size(self, name: str) -> bool:
+        """Whether a derivative is remembered as no smaller than its source."""
+        with self._lock:
+            if name not in self._full_size:
+                return False
+            self._full_size.move_to_end(name)
+            return True
+
+    def _lookup(self, name: str, path: str) -> bool:
+        """Mark a derivative as used if it is on disk, adopting one another process wrote."""
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return True
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return False
+        with self._lock:
+            self.hits += 1
+            self._add(name, size)
+        return True
+
+    def forget(self, path: str) -> None:
+        """Drop a derivative found missing on disk, e.g. evicted by another process."""
+        with self._lock:
+            size = self._entries.pop(os.path.basename(path), None)
+            if size is not None:
+                self._size -= size
+
+    def _add(self, name: str, size: int) -> None:
+        """Record a derivative and evict until within budget; called with _lock held."""
+        self._size -= self._entries.pop(name, 0)
+        self._entries[name] = size
+        self._size += size
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used derivatives over budget, always keeping the newest."""
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        """Return generation and eviction counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'generated': self.generated,
+                'skipped': self.skipped,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from env_config import setup_environment
+    from static_cache import StaticCache
+
+    config = setup_environment()
+    parser = argparse.ArgumentParser(description="Generate resized images for every configured width.")
+    parser.add_argument("--source", default="static/img", help="directory of full-size images")
+    parser.add_argument("--widths", default=",".join(map(str, config['IMAGE_WIDTHS'])),
+                        help="comma-separated widths in pixels")
+    parser.add_argument("--quality", type=int, default=config['IMAGE_QUALITY'], help="JPEG quality")
+    args = parser.parse_args(argv)
+    if Image is None:
+        print("Pillow is not installed (pip install Pillow); nothing to generate", file=sys.stderr)
+        return 1
+
+    cache = DerivativeCache(config['IMAGE_CACHE_DIR'], config['IMAGE_CACHE_BYTES'])
+    digests = StaticCache()
+    widths = sorted(int(width) for width in args.widths.split(","))
+    quality = min(max(args.quality, MIN_QUALITY), MAX_QUALITY)
+    for name in sorted(os.listdir(args.source)):
+        if name.rpartition(".")[2].lower() not in IMAGE_FORMATS:
+            continue
+        source = os.path.join(args.source, name)
+        digest = digests.info(source).etag.strip('"')
+        for width in widths:
+            path = cache.get(source, digest, width, quality)
+            if path is not None:
+                print(f"{source} w={width}: {os.path.getsize(source)} -> {os.path.getsize(path)} bytes")
+    print(f"{cache.stats()['entries']} derivatives, {cache.stats()['bytes']} bytes in {cache.directory}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
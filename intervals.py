@@ -0,0 +1,111 @@
+"""
+Interval indexing and overlap detection for Schedule Server
+Sebas Osorio
+"""
+
+import bisect
+from typing import Dict, Iterable, List, Set, Tuple
+
+# Times are minutes after midnight, so every interval lies within [0, DAY]
+DAY = 24 * 60
+
+# (start, end, id) with start < end
+Interval = Tuple[int, int, int]
+
+
+class IntervalIndex:
+    """Half-open intervals over one day, answering overlap queries in O(log n + k).
+
+    Two structures are kept up to date on every add():
+
+    - every interval sorted by start, which finds those starting inside the
+      query window with two bisections;
+    - a centred interval tree over the fixed [0, DAY] domain, which finds
+      those already running when the window opens (a stabbing query). The
+      centres are fixed by halving the domain, so the tree never needs
+      rebalancing and is at most log2(DAY) levels deep.
+    """
+
+    def __init__(self):
+        self._by_start: List[Tuple[int, int]] = []
+        # centre -> ((start, id) sorted, (end, start, id) sorted)
+        self._nodes: Dict[int, Tuple[List[Tuple[int, int]], List[Tuple[int, int, int]]]] = {}
+
+    def __len__(self) -> int:
+        return len(self._by_start)
+
+    def add(self, start: int, end: int, item_id: int) -> None:
+        """Index the interval [start, end) under item_id."""
+        bisect.insort(self._by_start, (start, item_id))
+        lo, hi = 0, DAY
+        while True:
+            centre = (lo + hi) // 2
+            if end <= centre:
+                hi = centre
+            elif start > centre:
+                lo = centre + 1
+            else:
+                by_start, by_end = self._nodes.setdefault(centre, ([], []))
+                bisect.insort(by_start, (start, item_id))
+                bisect.insort(by_end, (end, start, item_id))
+                return
+
+    def overlapping(self, start: int, end: int) -> Set[int]:
+        """Return the ids of intervals that overlap [start, end)."""
+        # Intervals starting inside the window
+        first = bisect.bisect_left(self._by_start, (start, -1))
+        last = bisect.bisect_left(self._by_start, (end, -1))
+        found = {item_id for _, item_id in self._by_start[first:last]}
+
+        # Intervals that started earlier and are still running at start.
+        # Every interval stored at a node contains the node's centre.
+        lo, hi = 0, DAY
+        while lo < hi:
+            centre = (lo + hi) // 2
+            node = self._nodes.get(centre)
+            if start < centre:
+                # These all end after the centre, so after start too
+                if node:
+                    by_start = node[0]
+                    found.update(item_id for _, item_id in by_start[:bisect.bisect_left(by_start, (start, -1))])
+                hi = centre
+            else:
+                # These all began by the centre; keep those still running at start
+                if node:
+                    by_end = node[1]
+                    found.update(item_id for _, item_start, item_id in by_end[bisect.bisect_right(by_end, (start, DAY)):]
+                                 if item_start < start)
+                lo = centre + 1
+        return found
+
+
+def overlapping_pairs(intervals: Iterable[Interval]) -> List[Tuple[int, int]]:
+    """Find every pair of overlapping intervals with a sweep line.
+
+    Endpoints are visited in time order while the set of running intervals
+    is maintained, so the cost is O(n log n + k) for k pairs rather than
+    comparing every interval with every other.
+
+    Args:
+        intervals: (start, end, id) triples
+
+    Returns:
+        Sorted (lower id, higher id) pairs, each reported once
+    """
+    points = []
+    for start, end, item_id in intervals:
+        # Ends sort before starts at the same minute: touching is not overlapping
+        points.append((start, 1, item_id))
+        points.append((end, 0, item_id))
+    points.sort()
+
+    active: Set[int] = set()
+    pairs = []
+    for _, is_start, item_id in points:
+        if is_start:
+            pairs.extend((min(item_id, other), max(item_id, other)) for other in active)
+            active.add(item_id)
+        else:
+            active.discard(item_id)
+    pairs.sort()
+    return pairs
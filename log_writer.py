@@ -0,0 +1,248 @@
+"""
+Background, batched log writing with rotation for Schedule Server
+Sebas Osorio
+"""
+
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+# What a full queue does to the caller: lose the line, or wait for room
+POLICIES = ("drop", "block")
+
+# Queued by close() to tell the writer thread to finish
+_STOP = object()
+
+
+class LogWriter:
+    """Appends lines to a file from a background thread.
+
+    Callers only put a record on a bounded queue; formatting, writing,
+    flushing and rotation all happen on the writer thread, so disk latency
+    never shows up in request latency. Lines are written in batches, flushed
+    once batch_lines have accumulated or flush_interval has passed.
+
+    When the queue is full the 'drop' policy discards the record (and counts
+    it) while 'block' makes the caller wait for room.
+
+    The file is rotated when it grows past max_bytes or every
+    rotate_interval seconds. Rotated files are renamed to path.1, path.2, ...
+    (gzip-compressed as path.1.gz, ... if compress is set) and only the
+    newest backups are kept. The writer reopens the file when another
+    process sharing it has rotated it.
+
+    The thread starts on first use and again after a fork, so a writer
+    created before prefork works in every worker.
+    """
+
+    def __init__(self, path: str, formatter: Callable[[Any], str] = str, queue_size: int = 8192,
+                 batch_lines: int = 256, flush_interval: float = 1.0, max_bytes: int = 0,
+                 rotate_interval: float = 0.0, backups: int = 5, compress: bool = True,
+                 policy: str = "drop"):
+        """
+        Args:
+            path: File to append to
+            formatter: Turns a queued record into the text to write; runs on
+                the writer thread
+            queue_size: Records that may wait for the writer
+            batch_lines: Records written per batch at most
+            flush_interval: Seconds a record may wait before being written
+            max_bytes: Rotate once the file reaches this size (0: never)
+            rotate_interval: Rotate after this many seconds (0: never)
+            backups: Rotated files to keep
+            compress: Whether rotated files are gzip-compressed
+            policy: 'drop' or 'block', for when the queue is full
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown log policy {policy!r}; expected one of {', '.join(POLICIES)}")
+        self.path = path
+        self.formatter = formatter
+        self.queue_size = queue_size
+        self.batch_lines = batch_lines
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.compress = compress
+        self.policy = policy
+
+        self._start_lock = threading.Lock()
+        self._drop_lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._queue: "queue.Queue[Any]" = queue.Queue(queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        self._opened_at = 0.0
+
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.rotations = 0
+        self.errors = 0
+
+    # Called on request threads
+
+    def write(self, record: Any) -> bool:
+        """Queue a record for writing.
+
+        Returns:
+            False if the record was dropped because the queue was full
+        """
+        if self._pid != os.getpid():
+            self._start()
+        if self.policy == "block":
+            self._queue.put(record)
+            return True
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            with self._drop_lock:
+                self.dropped += 1
+            return False
+
+    def close(self) -> None:
+        """Write out everything queued and stop the writer thread."""
+        if self._pid != os.getpid() or self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        self._pid = None
+
+    def stats(self) -> Dict[str, int]:
+        """Return write, drop and rotation counters."""
+        return {
+            'written': self.written,
+            'dropped': self.dropped,
+            'batches': self.batches,
+            'rotations': self.rotations,
+            'errors': self.errors,
+            'queued': self._queue.qsize(),
+        }
+
+    def _start(self) -> None:
+        """Start the writer thread in this process."""
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            # After a fork the parent's thread is gone and its queue may hold
+            # records the parent will write itself
+            self._queue = queue.Queue(self.queue_size)
+            self._file = None
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+
+    # Writer thread
+
+    def _run(self) -> None:
+        """Collect records into batches and write them until stopped."""
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                record = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                record = None
+            stopping = record is _STOP
+            if record is not None and not stopping:
+                batch.append(record)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+
+            if batch and (stopping or len(batch) >= self.batch_lines or time.monotonic() >= deadline):
+                self._write_batch(batch)
+                batch = []
+                deadline = None
+            if stopping:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write_batch(self, batch: list) -> None:
+        """Format and append a batch, rotating the file first if it is due."""
+        try:
+            data = "".join(self.formatter(record) for record in batch)
+            self._open()
+            if self._rotation_due():
+                self._rotate()
+                self._open()
+            self._file.write(data)
+            self._file.flush()
+            self.written += len(batch)
+            self.batches += 1
+        except Exception:
+            # Never let a logging failure take down the writer; the batch is lost
+            self.errors += 1
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _open(self) -> None:
+        """Open the file, or reopen it if another process rotated it away."""
+        if self._file is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._file.fileno()).st_ino:
+                    return
+            except FileNotFoundError:
+                pass
+            self._file.close()
+        self._file = open(self.path, "a")
+        self._opened_at = time.time()
+
+    def _rotation_due(self) -> bool:
+        """Check the size and age limits of the open file."""
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            return True
+        return bool(self.rotate_interval) and time.time() - self._opened_at >= self.rotate_interval
+
+    def _rotate(self) -> None:
+        """Shift backups along, move the live file to .1 and compress it."""
+        self._file.close()
+        self._file = None
+        suffix = ".gz" if self.compress else ""
+        for number in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{number}{suffix}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{number + 1}{suffix}")
+        if self.backups <= 0:
+            os.remove(self.path)
+        elif self.compress:
+            rotated = f"{self.path}.1"
+            os.replace(self.path, rotated)
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+        else:
+            os.replace(self.path, f"{self.path}.1")
+        self.rotations += 1
+
+
+class LogWriterHandler(logging.Handler):
+    """logging handler that hands records to a LogWriter instead of writing inline."""
+
+    def __init__(self, writer: LogWriter):
+        super().__init__()
+        self.writer = writer
+        writer.formatter = lambda record: self.format(record) + "\n"
+
+    def emit(self, record: logging.LogRecord) -> None:
+        # Render the message now; the arguments may change after we return
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        self.writer.write(record)
+
+    def close(self) -> None:
+        self.writer.close()
+        super().close()
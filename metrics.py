@@ -0,0 +1,208 @@
+"""
+Request metrics and latency histograms for Schedule Server
+Sebas Osorio
+"""
+
+import bisect
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Upper bounds of the latency buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+# Phases of a request that are timed separately
+PHASES = ("parse", "handler", "send")
+
+# Route label for requests no route matched
+UNMATCHED = "unmatched"
+
+# Returns counters to publish alongside the request metrics
+Collector = Callable[[], Dict[str, Any]]
+
+
+class _Shard:
+    """One thread's counters; only that thread ever writes to it."""
+
+    __slots__ = ('thread', 'latency', 'responses', 'route')
+
+    def __init__(self):
+        self.thread = threading.current_thread()
+        # (route, phase) -> bucket counts (last is +Inf), then the sum of seconds
+        self.latency: Dict[Tuple[str, str], List[float]] = {}
+        # (route, status) -> [responses, body bytes]
+        self.responses: Dict[Tuple[str, int], List[int]] = {}
+        # Route of the request this thread is handling
+        self.route: Optional[str] = None
+
+
+class Metrics:
+    """Per-route request counters and latency histograms.
+
+    Every thread records into its own shard, so the request path takes no
+    lock and never contends with other requests; shards are only summed
+    when the metrics are read. Shards of threads that have exited are
+    folded into one, so thread-per-connection servers do not leak them.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.collectors: Dict[str, Collector] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = _Shard()
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    # Recording, on request threads
+
+    def route_timed(self, route: str, seconds: float) -> None:
+        """Router timing hook: record handler latency and remember the route."""
+        shard = self._shard()
+        shard.route = route
+        self._observe(shard, route, "handler", seconds)
+
+    def take_route(self) -> str:
+        """Return (and forget) the route this thread last dispatched to."""
+        shard = self._shard()
+        route, shard.route = shard.route, None
+        return route or UNMATCHED
+
+    def observe(self, route: str, phase: str, seconds: float) -> None:
+        """Record how long one phase of a request took."""
+        self._observe(self._shard(), route, phase, seconds)
+
+    def _observe(self, shard: _Shard, route: str, phase: str, seconds: float) -> None:
+        counts = shard.latency.get((route, phase))
+        if counts is None:
+            counts = shard.latency[(route, phase)] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    def count_response(self, route: str, status: int, body_bytes: int) -> None:
+        """Record a response sent for a route."""
+        shard = self._shard()
+        totals = shard.responses.get((route, status))
+        if totals is None:
+            totals = shard.responses[(route, status)] = [0, 0]
+        totals[0] += 1
+        totals[1] += body_bytes
+
+    # Reading
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Sum every shard into plain dicts.
+
+        Returns:
+            {'latency': {(route, phase): counts}, 'responses': {(route, status): [n, bytes]}}
+        """
+        with self._lock:
+            live = []
+            for shard in self._shards:
+                if shard.thread.is_alive():
+                    live.append(shard)
+                else:
+                    _merge(self._retired, shard)
+            self._shards = live
+            shards = [self._retired] + live
+
+            latency: Dict[Tuple[str, str], List[float]] = {}
+            responses: Dict[Tuple[str, int], List[int]] = {}
+            for shard in shards:
+                _merge_into(latency, shard.latency)
+                _merge_into(responses, shard.responses)
+        return {'latency': latency, 'responses': responses}
+
+    def to_json(self) -> Dict[str, Any]:
+        """Metrics as a JSON-serialisable dict."""
+        snapshot = self.snapshot()
+        routes: Dict[str, Dict[str, Any]] = {}
+        for (route, status), (count, body_bytes) in sorted(snapshot['responses'].items()):
+            entry = routes.setdefault(route, {"requests": 0, "bytes": 0, "status": {}, "latency": {}})
+            entry["requests"] += count
+            entry["bytes"] += body_bytes
+            entry["status"][str(status)] = count
+        for (route, phase), counts in sorted(snapshot['latency'].items()):
+            entry = routes.setdefault(route, {"requests": 0, "bytes": 0, "status": {}, "latency": {}})
+            entry["latency"][phase] = {
+                "count": sum(counts[:-1]),
+                "sum": counts[-1],
+                "buckets": {_le(bound): total for bound, total in zip(
+                    self.buckets + (float("inf"),), _cumulative(counts[:-1]))},
+            }
+        return {
+            "routes": routes,
+            "stats": {name: collect() for name, collect in self.collectors.items()},
+        }
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP http_requests_total Responses sent, by route and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (route, status), (count, _) in sorted(snapshot['responses'].items()):
+            lines.append(f'http_requests_total{{route="{route}",status="{status}"}} {count}')
+        lines += [
+            "# HELP http_response_bytes_total Response body bytes sent, by route and status code.",
+            "# TYPE http_response_bytes_total counter",
+        ]
+        for (route, status), (_, body_bytes) in sorted(snapshot['responses'].items()):
+            lines.append(f'http_response_bytes_total{{route="{route}",status="{status}"}} {body_bytes}')
+        lines += [
+            "# HELP http_request_duration_seconds Time spent in each phase of a request.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (route, phase), counts in sorted(snapshot['latency'].items()):
+            labels = f'route="{route}",phase="{phase}"'
+            cumulative = _cumulative(counts[:-1])
+            for bound, total in zip(self.buckets + (float("inf"),), cumulative):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{_le(bound)}"}} {total}')
+            lines.append(f"http_request_duration_seconds_sum{{{labels}}} {counts[-1]:.6f}")
+            lines.append(f"http_request_duration_seconds_count{{{labels}}} {cumulative[-1]}")
+        for name, collect in self.collectors.items():
+            for key, value in collect().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f"schedule_{name}_{key}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _merge(into: _Shard, shard: _Shard) -> None:
+    """Fold an exited thread's counters into the retired shard."""
+    _merge_into(into.latency, shard.latency)
+    _merge_into(into.responses, shard.responses)
+
+
+def _merge_into(into: Dict[Any, List], counters: Dict[Any, List]) -> None:
+    # list() copies in one step, so a thread adding a key cannot break the loop
+    for key, values in list(counters.items()):
+        total = into.get(key)
+        if total is None:
+            into[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                total[i] += value
+
+
+def _cumulative(counts: List[float]) -> List[int]:
+    totals, running = [], 0
+    for count in counts:
+        running += count
+        totals.append(int(running))
+    return totals
+
+
+def _le(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
@@ -0,0 +1,134 @@
+"""
+Prefork process supervisor for Schedule Server
+Sebas Osorio
+"""
+
+import logging
+import os
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger('personal_website')
+
+# Serves requests in a worker process; receives the shared listening socket,
+# or None when each worker binds its own with SO_REUSEPORT
+WorkerMain = Callable[[Optional[socket.socket]], None]
+
+
+def reuse_port_supported() -> bool:
+    """Check whether this platform lets several sockets bind one port."""
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def listen_socket(host: str, port: int, backlog: int = 128) -> socket.socket:
+    """Bind a listening socket that forked workers can share."""
+    sock = socket.create_server((host, port), backlog=backlog, reuse_port=False)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Supervisor:
+    """Start worker processes on one host/port and restart any that die.
+
+    With SO_REUSEPORT each worker binds its own socket and the kernel spreads
+    connections across them; otherwise the supervisor binds one listening
+    socket before forking and every worker accepts on it.
+    """
+
+    # A worker that dies sooner than this after starting counts as crash-looping
+    MIN_UPTIME = 1.0
+
+    def __init__(self, worker_main: WorkerMain, host: str, port: int, processes: int):
+        """
+        Args:
+            worker_main: Function that serves requests inside a worker
+            host: Address the workers listen on
+            port: Port the workers listen on
+            processes: Number of worker processes to keep running
+        """
+        self.worker_main = worker_main
+        self.host = host
+        self.port = port
+        self.processes = processes
+        self.sock: Optional[socket.socket] = None
+        self.workers: Dict[int, float] = {}
+        self.restarts = 0
+        self._stopping = False
+
+    def spawn(self) -> None:
+        """Fork one worker process."""
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = time.monotonic()
+            return
+
+        # Child: Ctrl+C goes to the whole process group, so leave it to the
+        # supervisor and shut down only when it sends SIGTERM
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, raise_interrupt)
+        code = 0
+        try:
+            self.worker_main(self.sock)
+        except KeyboardInterrupt:
+            pass
+        except BaseException:
+            logger.exception("Worker process crashed")
+            code = 1
+        finally:
+            logging.shutdown()
+            os._exit(code)
+
+    def run(self) -> None:
+        """Start the workers and supervise them until interrupted."""
+        if not reuse_port_supported():
+            self.sock = listen_socket(self.host, self.port)
+
+        signal.signal(signal.SIGTERM, raise_interrupt)
+        try:
+            for _ in range(self.processes):
+                self.spawn()
+            self._watch()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def _watch(self) -> None:
+        """Reap exited workers and start replacements."""
+        while True:
+            pid, status = os.wait()
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            logger.error(f"Worker {pid} exited with status {status}; restarting")
+            self.restarts += 1
+            if time.monotonic() - started < self.MIN_UPTIME:
+                time.sleep(self.MIN_UPTIME)
+            self.spawn()
+
+    def stop(self) -> None:
+        """Ask every worker to drain and exit, then wait for them."""
+        if self._stopping:
+            return
+        self._stopping = True
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.workers):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.workers.pop(pid, None)
+        if self.sock is not None:
+            self.sock.close()
+
+
+def raise_interrupt(signum, frame):
+    """Turn SIGTERM into the KeyboardInterrupt the serving loops already handle."""
+    raise KeyboardInterrupt
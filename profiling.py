@@ -0,0 +1,347 @@
+"""
+Request profiling and slow-request tracing for Schedule Server
+Sebas Osorio
+
+Every request gets a trace of how long it spent in each phase: parse
+(request line, headers and body), handler (the route), render
+(compression and response headers), log (queueing the access log entry)
+and send. Requests slower than a threshold are logged with their trace
+and kept for /admin/profile. While profiling is on, a fraction of
+requests is also run under cProfile and the results are summed per route,
+to be written out as .prof files for pstats or snakeviz.
+
+Profiling is switched at runtime through a small control file in the
+profile directory, so every worker process of a preforked server follows
+the same switch within a second.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+from collections import deque
+from io import StringIO
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from metrics import UNMATCHED
+
+logger = logging.getLogger('personal_website')
+
+# Phases of a trace, in the order they happen
+TRACE_PHASES = ("parse", "handler", "render", "log", "send")
+
+# Orders a profile report can be sorted in
+REPORT_SORTS = ("cumulative", "tottime", "ncalls")
+
+# Name of the file that carries runtime settings between processes
+CONTROL_FILE = "control.json"
+
+
+class Trace:
+    """Phase timings of one request, filled in as it moves through the server."""
+
+    __slots__ = ('started', 'method', 'path', 'route', 'status', 'phases', 'profiled')
+
+    def __init__(self, method: str, path: str):
+        self.started = time.time()
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.phases: Dict[str, float] = {}
+        self.profiled = False
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def total(self) -> float:
+        return sum(self.phases.values())
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "time": round(self.started, 3),
+            "method": self.method,
+            "path": self.path,
+            "route": self.route or UNMATCHED,
+            "status": self.status,
+            "total_ms": round(self.total() * 1000, 3),
+            "phases_ms": {phase: round(self.phases[phase] * 1000, 3)
+                          for phase in TRACE_PHASES if phase in self.phases},
+            "profiled": self.profiled,
+        }
+
+
+class Profiler:
+    """Slow-request traces plus sampled, per-route cProfile statistics.
+
+    Only one request is profiled at a time: samples that arrive while
+    another is running are skipped rather than queued, so profiling never
+    serialises the server (and Python 3.12+ allows one active profiler).
+    """
+
+    def __init__(self, directory: str, enabled: bool = False, sample_rate: float = 0.01,
+                 slow_seconds: float = 0.5, keep_traces: int = 100, check_interval: float = 1.0):
+        """
+        Args:
+            directory: Where profiles and the control file are written
+            enabled: Whether requests are sampled under cProfile at startup
+            sample_rate: Fraction of requests profiled while enabled
+            slow_seconds: Requests taking at least this long are traced (0 disables)
+            keep_traces: Slow-request traces kept in memory
+            check_interval: Seconds between checks of the control file
+        """
+        self.directory = directory
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.check_interval = check_interval
+        self.control_path = os.path.join(directory, CONTROL_FILE)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sampling = threading.Lock()
+        self._profiles: Dict[str, Tuple[pstats.Stats, int]] = {}
+        self._slow: "deque[Dict[str, Any]]" = deque(maxlen=keep_traces)
+        self._next_check = 0.0
+        # Settings left in the control file by an earlier run do not apply
+        self._control_mtime = self._control_version()
+        self._dump_generation = 0
+
+        self.sampled = 0
+        self.busy = 0
+        self.slow = 0
+        self.dumps = 0
+
+    # Request path, on the thread that builds the response
+
+    def begin(self, method: str, path: str) -> Optional[Trace]:
+        """Start the trace of a request on this thread.
+
+        Returns:
+            The trace, or None if neither tracing nor profiling is on
+        """
+        self._sync()
+        if not self.enabled and not self.slow_seconds:
+            self._local.trace = None
+            return None
+        trace = self._local.trace = Trace(method, path)
+        return trace
+
+    def build(self, trace: Trace, build: Callable[..., Tuple[Any, int, Dict[str, str]]],
+              *args: Any) -> Tuple[Any, int, Dict[str, str]]:
+        """Run build(*args), timing it as the handler and render phases, and profile it if sampled."""
+        profile = self._start_sample()
+        started = time.perf_counter()
+        try:
+            response = build(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                self._stop_sample(profile, trace)
+        trace.status = response[1]
+        trace.add("render", max(0.0, elapsed - trace.phases.get("handler", 0.0) - trace.phases.get("log", 0.0)))
+        return response
+
+    def route_timed(self, route: str, seconds: float) -> None:
+        """Router timing hook: note the route and its handler time in this thread's trace."""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.route = route
+            trace.add("handler", seconds)
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add time spent in a phase to this thread's trace, if it has one."""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.add(phase, seconds)
+
+    def take(self) -> Optional[Trace]:
+        """Return (and forget) this thread's trace, for the engine to finish once it is sent."""
+        trace = getattr(self._local, "trace", None)
+        self._local.trace = None
+        return trace
+
+    def finish(self, trace: Trace, parse_seconds: float, send_seconds: float) -> None:
+        """Complete a trace with the engine's timings and keep it if the request was slow."""
+        trace.add("parse", parse_seconds)
+        trace.add("send", send_seconds)
+        if not self.slow_seconds or trace.total() < self.slow_seconds:
+            return
+        entry = trace.to_json()
+        with self._lock:
+            self.slow += 1
+            self._slow.append(entry)
+        logger.warning(f"Slow request {trace.method} {trace.path}: {json.dumps(entry)}")
+
+    # Sampling
+
+    def _start_sample(self) -> Optional[cProfile.Profile]:
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._sampling.acquire(blocking=False):
+            with self._lock:
+                self.busy += 1
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, or python -m cProfile) is active
+            self._sampling.release()
+            return None
+        return profile
+
+    def _stop_sample(self, profile: cProfile.Profile, trace: Trace) -> None:
+        profile.disable()
+        self._sampling.release()
+        trace.profiled = True
+        route = trace.route or UNMATCHED
+        with self._lock:
+            self.sampled += 1
+            if route in self._profiles:
+                stats, samples = self._profiles[route]
+                stats.add(profile)
+                self._profiles[route] = (stats, samples + 1)
+            else:
+                self._profiles[route] = (pstats.Stats(profile), 1)
+
+    # Runtime control
+
+    def configure(self, enabled: Optional[bool] = None, sample_rate: Optional[float] = None,
+                  slow_seconds: Optional[float] = None, dump: bool = False) -> None:
+        """Change settings in every process sharing the profile directory.
+
+        Settings not given are left as they are. Turning profiling off, or
+        dump, writes out each process's profiles.
+
+        Raises:
+            ValueError: If sample_rate is outside 0-1 or slow_seconds is negative
+            OSError: If the control file cannot be written
+        """
+        if sample_rate is not None and not 0.0 <= sample_rate <= 1.0:
+            raise ValueError("sample rate must be between 0 and 1")
+        if slow_seconds is not None and not slow_seconds >= 0:
+            raise ValueError("slow threshold must not be negative")
+        with self._lock:
+            control = {
+                "enabled": self.enabled if enabled is None else enabled,
+                "sample_rate": self.sample_rate if sample_rate is None else sample_rate,
+                "slow_seconds": self.slow_seconds if slow_seconds is None else slow_seconds,
+                "dump": self._dump_generation + 1 if dump else self._dump_generation,
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(prefix=".", suffix=".json", dir=self.directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(control, f)
+            os.replace(temporary, self.control_path)
+        finally:
+            if os.path.exists(temporary):
+                os.unlink(temporary)
+        self._control_mtime = self._control_version()
+        self._apply(control)
+
+    def _control_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.control_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _sync(self) -> None:
+        """Pick up settings another process wrote, at most once per check_interval."""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        version = self._control_version()
+        if version is None or version == self._control_mtime:
+            return
+        self._control_mtime = version
+        try:
+            with open(self.control_path) as f:
+                control = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read profiling control file {self.control_path}: {e}")
+            return
+        self._apply(control)
+
+    def _apply(self, control: Dict[str, Any]) -> None:
+        enabled = bool(control.get("enabled", self.enabled))
+        with self._lock:
+            was_enabled, self.enabled = self.enabled, enabled
+            self.sample_rate = float(control.get("sample_rate", self.sample_rate))
+            self.slow_seconds = float(control.get("slow_seconds", self.slow_seconds))
+            dump = int(control.get("dump", 0)) > self._dump_generation
+            self._dump_generation = max(self._dump_generation, int(control.get("dump", 0)))
+            if enabled and not was_enabled:
+                # A new profiling session starts from empty profiles
+                self._profiles.clear()
+        logger.info(f"Profiling {'on' if enabled else 'off'}: sample rate {self.sample_rate}, "
+                    f"slow threshold {self.slow_seconds * 1000:.0f} ms")
+        if dump or (was_enabled and not enabled):
+            self.dump()
+
+    # Results
+
+    def dump(self) -> List[str]:
+        """Write each route's profile to <directory>/<route>.<pid>.prof.
+
+        Returns:
+            Paths written
+        """
+        with self._lock:
+            profiles = [(route, stats) for route, (stats, _) in self._profiles.items()]
+            if profiles:
+                self.dumps += 1
+        paths = []
+        if profiles:
+            os.makedirs(self.directory, exist_ok=True)
+        for route, stats in profiles:
+            path = os.path.join(self.directory, f"{route}.{os.getpid()}.prof")
+            with self._lock:
+                stats.dump_stats(path)
+            paths.append(path)
+        if paths:
+            logger.info(f"Wrote {len(paths)} request profiles to {self.directory}")
+        return paths
+
+    def report(self, route: str, sort: str = "cumulative", limit: int = 40) -> Optional[str]:
+        """Render the top functions of a route's profile in this process, or None if it has none."""
+        with self._lock:
+            if route not in self._profiles:
+                return None
+            stats, samples = self._profiles[route]
+            out = StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(limit)
+        return f"{route}: {samples} sampled requests in process {os.getpid()}\n{out.getvalue()}"
+
+    def status(self) -> Dict[str, Any]:
+        """Settings, sampled routes and recent slow requests of this process."""
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "enabled": self.enabled,
+                "sample_rate": self.sample_rate,
+                "slow_ms": self.slow_seconds * 1000,
+                "directory": self.directory,
+                "profiles": {route: samples for route, (_, samples) in sorted(self._profiles.items())},
+                "slow_requests": list(self._slow),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """Return sampling and tracing counters."""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'sampled': self.sampled,
+                'busy': self.busy,
+                'slow': self.slow,
+                'profiled_routes': len(self._profiles),
+                'dumps': self.dumps,
+            }
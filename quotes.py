@@ -0,0 +1,221 @@
+"""
+Cached, coalescing stock quote proxy for Schedule Server
+Sebas Osorio
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.error import URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+# Query parameters passed through to the upstream; anything else (such as a
+# client-supplied apikey) is dropped
+QUOTE_PARAMS = ("function", "symbol", "interval", "outputsize")
+
+# Alpha Vantage function names and ticker symbols
+FUNCTION_RE = re.compile(r"^[A-Z_]{1,40}$")
+SYMBOL_RE = re.compile(r"^[A-Za-z0-9.\- ]{1,20}$")
+
+# Keys of the JSON objects Alpha Vantage answers with status 200 instead of
+# data: throttling notices, and errors such as an unknown symbol
+UPSTREAM_NOTICES = ("Error Message", "Note", "Information")
+
+# Fetches the upstream response body for a set of query parameters
+Upstream = Callable[[Dict[str, str]], bytes]
+
+
+class UpstreamError(Exception):
+    """The upstream could not be reached or refused to answer."""
+
+
+class AlphaVantage:
+    """Upstream that queries the Alpha Vantage REST API over HTTPS."""
+
+    def __init__(self, base_url: str, api_key: str, timeout: float = 10.0):
+        """
+        Args:
+            base_url: Query endpoint, e.g. https://www.alphavantage.co/query
+                (point it at a local fake for testing)
+            api_key: Key appended to every request; never sent to browsers
+            timeout: Seconds to wait for the upstream
+        """
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def __call__(self, params: Dict[str, str]) -> bytes:
+        """Fetch one response.
+
+        Raises:
+            UpstreamError: On network errors, non-200 responses, and the
+                throttling notices and errors (such as an unknown symbol)
+                Alpha Vantage sends with status 200
+        """
+        url = f"{self.base_url}?{urlencode(dict(params, apikey=self.api_key))}"
+        try:
+            with urlopen(url, timeout=self.timeout) as response:
+                body = response.read()
+        except (URLError, OSError) as e:
+            raise UpstreamError(str(e)) from e
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise UpstreamError("upstream response is not JSON") from None
+        if isinstance(data, dict):
+            for notice in UPSTREAM_NOTICES:
+                if notice in data:
+                    raise UpstreamError(str(data[notice]))
+        return body
+
+
+def parse_quote_params(params: Dict[str, str]) -> Dict[str, str]:
+    """Keep the parameters the upstream needs, checking their format.
+
+    Raises:
+        ValueError: If function or symbol is missing or malformed
+    """
+    query = {key: params[key] for key in QUOTE_PARAMS if params.get(key)}
+    if not FUNCTION_RE.match(query.get("function", "")):
+        raise ValueError("function must be an Alpha Vantage function name, e.g. TIME_SERIES_WEEKLY")
+    if not SYMBOL_RE.match(query.get("symbol", "")):
+        raise ValueError("symbol must be a ticker symbol, e.g. IBM")
+    query["symbol"] = query["symbol"].upper()
+    return query
+
+
+class _Entry:
+    __slots__ = ('body', 'fetched')
+
+    def __init__(self, body: bytes, fetched: float):
+        self.body = body
+        self.fetched = fetched
+
+
+class _Flight:
+    """An upstream call in progress that identical requests wait on."""
+
+    __slots__ = ('done', 'entry', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.entry: Optional[_Entry] = None
+        self.error: Optional[Exception] = None
+
+
+class QuoteProxy:
+    """TTL cache in front of a quote upstream.
+
+    A response younger than ttl is served from memory. Up to stale seconds
+    past that it is still served, while one background call refreshes it
+    (stale-while-revalidate), so a slow or failing upstream only delays
+    the refresh. Concurrent misses for the same query share a single
+    upstream call. Each worker process keeps its own cache.
+    """
+
+    def __init__(self, upstream: Upstream, ttl: float = 60.0, stale: float = 600.0,
+                 max_entries: int = 512):
+        """
+        Args:
+            upstream: Fetches a response body for a query
+            ttl: Seconds a response is fresh
+            stale: Further seconds a response may be served while it is refreshed
+            max_entries: Queries kept in memory
+        """
+        self.upstream = upstream
+        self.ttl = ttl
+        self.stale = stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Tuple[str, str], ...], _Entry]" = OrderedDict()
+        self._flights: Dict[Tuple[Tuple[str, str], ...], _Flight] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def get(self, query: Dict[str, str]) -> Tuple[bytes, float, str]:
+        """Answer a query from the cache or the upstream.
+
+        Returns:
+            (body, time it was fetched, 'hit' | 'stale' | 'miss')
+
+        Raises:
+            UpstreamError: If the upstream failed and nothing cached can stand in
+        """
+        key = tuple(sorted(query.items()))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                age = now - entry.fetched
+                if age < self.ttl:
+                    self.hits += 1
+                    return entry.body, entry.fetched, "hit"
+                if age < self.ttl + self.stale:
+                    self.stale_hits += 1
+                    if key not in self._flights:
+                        self._flights[key] = _Flight()
+                        threading.Thread(target=self._fetch, args=(key, query), daemon=True,
+                                         name="quote-refresh").start()
+                    return entry.body, entry.fetched, "stale"
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self.misses += 1
+            else:
+                leader = False
+                self.coalesced += 1
+
+        if leader:
+            self._fetch(key, query)
+        else:
+            flight.done.wait()
+        if flight.entry is None:
+            raise flight.error
+        return flight.entry.body, flight.entry.fetched, "miss"
+
+    def _fetch(self, key: Tuple[Tuple[str, str], ...], query: Dict[str, str]) -> None:
+        """Call the upstream for the flight registered under key and publish the result."""
+        flight = self._flights[key]
+        try:
+            body = self.upstream(query)
+            flight.entry = _Entry(body, time.time())
+        except Exception as e:
+            flight.error = e if isinstance(e, UpstreamError) else UpstreamError(str(e))
+        with self._lock:
+            self.upstream_calls += 1
+            if flight.entry is not None:
+                self._entries[key] = flight.entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                # A failed refresh leaves the stale copy in place; the next
+                # request within the stale window tries again
+                self.upstream_errors += 1
+            del self._flights[key]
+        flight.done.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return cache and upstream counters."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'upstream_calls': self.upstream_calls,
+                'upstream_errors': self.upstream_errors,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
@@ -0,0 +1,142 @@
+"""
+Byte-range requests and file-backed response bodies for Schedule Server
+Sebas Osorio
+"""
+
+import uuid
+from typing import BinaryIO, List, Optional, Tuple, Union
+
+from http_cache import Validated, etag_matches, http_date
+
+# More ranges than this in one request are ignored and the full file is sent
+MAX_RANGES = 16
+
+# A piece of a FileBody: literal bytes, or (offset, count) to copy from the file
+Part = Union[bytes, Tuple[int, int]]
+
+
+class RangeNotSatisfiable(Exception):
+    """Raised when none of the requested ranges overlap the file."""
+
+
+class FileBody:
+    """A response body streamed from a file instead of held in memory.
+
+    Engines copy the (offset, count) parts straight from the file descriptor
+    with sendfile, so memory use does not grow with the file size.
+    """
+
+    def __init__(self, path: str, parts: List[Part]):
+        """
+        Args:
+            path: File to stream from
+            parts: Literal bytes and (offset, count) file spans, in order
+        """
+        self.path = path
+        self.parts = parts
+
+    @classmethod
+    def whole(cls, path: str, size: int) -> "FileBody":
+        """Body covering an entire file."""
+        return cls(path, [(0, size)])
+
+    def __len__(self) -> int:
+        return sum(len(part) if isinstance(part, bytes) else part[1] for part in self.parts)
+
+    def open(self) -> BinaryIO:
+        """Open the underlying file for sending."""
+        return open(self.path, "rb")
+
+
+def parse_range(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """Parse a Range header into sorted, merged (start, end) byte positions.
+
+    Args:
+        header: Value of the Range header
+        size: Length of the file in bytes
+
+    Returns:
+        Inclusive (start, end) pairs, or None if the header should be ignored
+
+    Raises:
+        RangeNotSatisfiable: If the header is valid but no range fits the file
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for item in spec.split(","):
+        first, dash, last = item.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+                if last and end < start:
+                    return None
+            else:
+                suffix = int(last)
+                if suffix == 0:
+                    continue
+                start, end = max(size - suffix, 0), size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+    if not ranges:
+        raise RangeNotSatisfiable()
+
+    # Coalesce overlapping or adjacent ranges
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def if_range_matches(if_range: Optional[str], resource: Validated) -> bool:
+    """Check an If-Range precondition; a missing header always matches."""
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range requires a strong comparison
+        return not if_range.startswith("W/") and bool(resource.etag) and etag_matches(if_range, resource.etag)
+    return resource.last_modified is not None and if_range == http_date(resource.last_modified)
+
+
+def range_response(path: str, size: int, ranges: List[Tuple[int, int]],
+                   content_type: str) -> Tuple[FileBody, dict]:
+    """Build a 206 body and its headers for one or more byte ranges.
+
+    Returns:
+        Tuple with (body, headers to add to the response)
+    """
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return FileBody(path, [(start, end - start + 1)]), {
+            "Content-Range": f"bytes {start}-{end}/{size}",
+        }
+
+    boundary = uuid.uuid4().hex
+    parts: List[Part] = []
+    for start, end in ranges:
+        parts.append((
+            f"\r\n--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1"))
+        parts.append((start, end - start + 1))
+    parts.append(f"\r\n--{boundary}--\r\n".encode("latin-1"))
+    return FileBody(path, parts), {
+        "Content-Type": f"multipart/byteranges; boundary={boundary}",
+    }
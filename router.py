@@ -0,0 +1,150 @@
+"""
+Declarative request routing for Schedule Server
+Sebas Osorio
+"""
+
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+from body_parser import Body
+
+# Called after every dispatch with (route name, seconds spent in the handler)
+TimingHook = Callable[[str, float], None]
+
+
+class HTTPError(Exception):
+    """Raised by a handler to answer with an error status instead of a page."""
+
+    def __init__(self, code: int, message: str, content_type: str = "text/plain; charset=utf-8",
+                 headers: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            code: HTTP status code
+            message: Response body
+            content_type: MIME type of the body
+            headers: Extra response headers
+        """
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.content_type = content_type
+        self.headers = headers or {}
+
+
+class Request:
+    """What a route handler gets to see of a request."""
+
+    __slots__ = ('method', 'path', 'query_string', 'body', 'form', 'match', 'headers')
+
+    def __init__(self, method: str, path: str, query_string: Optional[str],
+                 body: Optional[Body], form: Dict[str, str], match: Optional["re.Match"],
+                 headers: Optional[Dict[str, str]] = None):
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.body = body
+        self.form = form
+        self.match = match
+        # Request headers with lower-cased names
+        self.headers = headers or {}
+
+
+class Route:
+    """A handler plus the conditions under which it runs."""
+
+    __slots__ = ('name', 'handler', 'methods', 'needs_body')
+
+    def __init__(self, name: str, handler: Callable[[Request], Any],
+                 methods: Iterable[str], needs_body: bool):
+        self.name = name
+        self.handler = handler
+        self.methods = frozenset(methods)
+        self.needs_body = needs_body
+
+
+class Router:
+    """Route table with exact paths, regex patterns and path prefixes.
+
+    Exact paths are looked up in a dict keyed by (method, path). Patterns are
+    tried next in registration order, then prefixes from longest to shortest.
+    Only routes that declare needs_body get their form body parsed.
+    """
+
+    def __init__(self, parse_body: Callable[[Optional[Body]], Dict[str, str]]):
+        """
+        Args:
+            parse_body: Turns a raw request body into form parameters
+        """
+        self.parse_body = parse_body
+        self.timing_hooks: List[TimingHook] = []
+        self._exact: Dict[Tuple[str, str], Route] = {}
+        self._patterns: List[Tuple[Pattern, Route]] = []
+        self._prefixes: List[Tuple[str, Route]] = []
+
+    def add(self, name: str, handler: Callable[[Request], Any], *,
+            paths: Iterable[str] = (), pattern: Optional[str] = None, prefix: Optional[str] = None,
+            methods: Iterable[str] = ("GET",), needs_body: bool = False) -> Route:
+        """Register a route.
+
+        Args:
+            name: Name used in timing hooks and logs
+            handler: Called with a Request; returns (content, MIME type)
+            paths: Exact URL paths the route answers
+            pattern: Regular expression matched against the whole path
+            prefix: Path prefix the route answers
+            methods: HTTP methods the route accepts
+            needs_body: Whether the form body should be parsed for the handler
+
+        Returns:
+            The registered route
+        """
+        route = Route(name, handler, methods, needs_body)
+        for path in paths:
+            for method in route.methods:
+                self._exact[(method, path)] = route
+        if pattern is not None:
+            self._patterns.append((re.compile(pattern), route))
+        if prefix is not None:
+            self._prefixes.append((prefix, route))
+            self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+        return route
+
+    def match(self, method: str, path: str) -> Optional[Tuple[Route, Optional["re.Match"]]]:
+        """Find the route for a request, or None if nothing accepts it."""
+        route = self._exact.get((method, path))
+        if route is not None:
+            return route, None
+        for regex, route in self._patterns:
+            if method in route.methods:
+                m = regex.fullmatch(path)
+                if m is not None:
+                    return route, m
+        for prefix, route in self._prefixes:
+            if method in route.methods and path.startswith(prefix):
+                return route, None
+        return None
+
+    def dispatch(self, method: str, path: str, query_string: Optional[str],
+                 body: Optional[Body], headers: Optional[Dict[str, str]] = None) -> Optional[Any]:
+        """Run the matching route's handler.
+
+        Returns:
+            The handler's (content, MIME type), or None if no route matched
+        """
+        matched = self.match(method, path)
+        if matched is None:
+            return None
+        route, m = matched
+        form = self.parse_body(body) if route.needs_body and body else {}
+        request = Request(method, path, query_string, body, form, m, headers)
+
+        if not self.timing_hooks:
+            return route.handler(request)
+        start = time.perf_counter()
+        try:
+            return route.handler(request)
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in self.timing_hooks:
+                hook(route.name, elapsed)
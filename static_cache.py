@@ -0,0 +1,171 @@
+"""
+In-memory static asset cache for Schedule Server
+Sebas Osorio
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+
+# Files are hashed in pieces of this size so large files never sit in memory
+HASH_CHUNK = 256 * 1024
+
+# Upper bound on remembered file digests before the table is reset
+MAX_DIGESTS = 4096
+
+
+class FileInfo:
+    """Stat data and strong ETag for a file, without its contents."""
+
+    __slots__ = ('path', 'mtime_ns', 'size', 'etag')
+
+    def __init__(self, path: str, mtime_ns: int, size: int, etag: str):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.etag = etag
+
+    @property
+    def mtime(self) -> float:
+        """Modification time as a Unix timestamp."""
+        return self.mtime_ns / 1e9
+
+
+class CacheEntry(FileInfo):
+    """A file body held in memory along with the stat data used to validate it.
+
+    The strong ETag is a hash of the body, computed once when the file is read.
+    """
+
+    __slots__ = ('body',)
+
+    def __init__(self, path: str, body: bytes, mtime_ns: int, size: int):
+        super().__init__(path, mtime_ns, size,
+                         '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        self.body = body
+
+
+class StaticCache:
+    """Bounded, byte-budgeted LRU cache of file bodies keyed by path.
+
+    Every lookup stats the file and compares mtime and size against the
+    cached entry, so edits on disk are picked up without a restart.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, max_file_bytes: Optional[int] = None):
+        """
+        Args:
+            max_bytes: Total size of cached bodies before entries are evicted
+            max_file_bytes: Files larger than this are read but never cached
+                (defaults to a quarter of max_bytes)
+        """
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes if max_file_bytes is not None else max_bytes // 4
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._size = 0
+        self._digests: Dict[str, FileInfo] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path: str) -> CacheEntry:
+        """Return the entry for a file, reading it from disk on a miss.
+
+        Args:
+            path: Path of the file to load
+
+        Returns:
+            The cache entry holding the file body
+
+        Raises:
+            OSError: If the file cannot be stat'ed or opened, as open() would
+        """
+        st = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        with open(path, 'rb') as f:
+            # Stat the open descriptor so the entry matches the bytes we read
+            st = os.fstat(f.fileno())
+            body = f.read()
+
+        entry = CacheEntry(path, body, st.st_mtime_ns, st.st_size)
+        if len(body) <= self.max_file_bytes:
+            self._store(entry)
+        return entry
+
+    def info(self, path: str) -> FileInfo:
+        """Return size, mtime and ETag for a file without caching its body.
+
+        Used for large binary files that are streamed rather than held in
+        memory. The digest is computed in fixed-size pieces, once per version
+        of the file.
+
+        Raises:
+            OSError: If the file cannot be stat'ed or opened, as open() would
+        """
+        st = os.stat(path)
+        with self._lock:
+            info = self._digests.get(path)
+            if info is not None and info.mtime_ns == st.st_mtime_ns and info.size == st.st_size:
+                return info
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+                digest.update(chunk)
+
+        info = FileInfo(path, st.st_mtime_ns, st.st_size, '"' + digest.hexdigest() + '"')
+        with self._lock:
+            if len(self._digests) >= MAX_DIGESTS:
+                self._digests.clear()
+            self._digests[path] = info
+        return info
+
+    def _store(self, entry: CacheEntry) -> None:
+        """Insert an entry and evict least recently used ones until within budget."""
+        with self._lock:
+            old = self._entries.pop(entry.path, None)
+            if old is not None:
+                self._size -= len(old.body)
+            self._entries[entry.path] = entry
+            self._size += len(entry.body)
+
+            while self._size > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted.body)
+                self.evictions += 1
+
+    def invalidate(self, path: Optional[str] = None) -> None:
+        """Drop a single path from the cache, or everything if no path is given."""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._size = 0
+                return
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._size -= len(entry.body)
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters that can be used to size the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
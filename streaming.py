@@ -0,0 +1,32 @@
+"""
+Streamed response bodies for Schedule Server
+Sebas Osorio
+"""
+
+from typing import Iterable, Iterator
+
+
+class StreamBody:
+    """A response body produced piece by piece by an iterator of bytes.
+
+    Its length is unknown up front, so engines send it with
+    Transfer-Encoding: chunked (or, for HTTP/1.0 clients, by closing the
+    connection at the end).
+    """
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = chunks
+
+    def __iter__(self) -> Iterator[bytes]:
+        for chunk in self.chunks:
+            if chunk:
+                yield chunk
+
+
+def encode_chunk(chunk: bytes) -> bytes:
+    """Frame one piece of a body for Transfer-Encoding: chunked."""
+    return b"%x\r\n%s\r\n" % (len(chunk), chunk)
+
+
+# Terminates a chunked body (no trailers)
+LAST_CHUNK = b"0\r\n\r\n"
@@ -0,0 +1,132 @@
+"""
+Precompiled page templates for Schedule Server
+Sebas Osorio
+"""
+
+import hashlib
+import os
+import re
+import threading
+from typing import Callable, Iterable, Iterator, List, Mapping, Optional, Tuple, Union
+
+# A {{NAME}} placeholder
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([A-Za-z_][A-Za-z0-9_]*)\s*\}\}")
+
+
+class Template:
+    """Text with {{NAME}} placeholders, compiled once into encoded byte segments.
+
+    Placeholders named in constants are substituted at compile time and
+    merged into the surrounding text, so rendering only joins the literal
+    segments with the remaining values. A template whose placeholders are
+    all constants is fully baked: its body and entity tag are computed once.
+    """
+
+    def __init__(self, source: str, constants: Optional[Mapping[str, str]] = None):
+        """
+        Args:
+            source: Template text
+            constants: Values baked in at compile time
+        """
+        constants = constants or {}
+        parts: List[Union[bytes, str]] = []
+        literal: List[str] = []
+        position = 0
+        for match in PLACEHOLDER_RE.finditer(source):
+            literal.append(source[position:match.start()])
+            name = match.group(1)
+            if name in constants:
+                literal.append(constants[name])
+            else:
+                parts.append("".join(literal).encode("utf-8"))
+                parts.append(name)
+                literal = []
+            position = match.end()
+        literal.append(source[position:])
+        parts.append("".join(literal).encode("utf-8"))
+
+        # Literal segments sit at even indexes, placeholder names at odd ones
+        self.parts = parts
+        self.fields: Tuple[str, ...] = tuple(parts[1::2])
+        self.body: Optional[bytes] = parts[0] if not self.fields else None
+        self.etag: Optional[str] = (
+            '"' + hashlib.blake2b(self.body, digest_size=16).hexdigest() + '"'
+            if self.body is not None else None)
+        # Modification time of the file the template was loaded from, if any
+        self.mtime: Optional[float] = None
+
+    def render(self, **values: Union[str, bytes]) -> bytes:
+        """Fill in the placeholders and return the page.
+
+        Raises:
+            KeyError: If a placeholder has no value
+        """
+        if self.body is not None:
+            return self.body
+        return b"".join(self.iter_render(**values))
+
+    def iter_render(self, **values: Union[str, bytes, Iterable[bytes]]) -> Iterator[bytes]:
+        """Yield the page in pieces; a value may itself be an iterable of bytes to stream."""
+        for index, part in enumerate(self.parts):
+            if not index % 2:
+                yield part
+                continue
+            value = values[part]
+            if isinstance(value, str):
+                yield value.encode("utf-8")
+            elif isinstance(value, bytes):
+                yield value
+            else:
+                yield from value
+
+
+class TemplateFile:
+    """A Template loaded from disk and recompiled when the file changes.
+
+    Each get() stats the file and recompiles only if its mtime or size
+    differs from the compiled copy, or the version of what transform
+    depends on has changed.
+    """
+
+    def __init__(self, path: str, constants: Optional[Mapping[str, str]] = None,
+                 transform: Optional[Callable[[str], str]] = None,
+                 version: Optional[Callable[[], str]] = None):
+        """
+        Args:
+            path: Template file
+            constants: Values baked in at compile time
+            transform: Applied to the file's text before compiling, e.g. to
+                turn a marker element into a placeholder
+            version: Returns a token for the inputs of transform besides the
+                file; the template is recompiled when it changes
+        """
+        self.path = path
+        self.constants = constants
+        self.transform = transform
+        self.version = version
+        self._lock = threading.Lock()
+        # ((mtime_ns, size, version), template), replaced as a whole on recompile
+        self._compiled: Optional[Tuple[Tuple[int, int, str], Template]] = None
+
+    def get(self) -> Template:
+        """Return the compiled template, recompiling it if the file changed.
+
+        Raises:
+            OSError: If the file cannot be read
+        """
+        st = os.stat(self.path)
+        key = (st.st_mtime_ns, st.st_size, self.version() if self.version is not None else "")
+        compiled = self._compiled
+        if compiled is not None and compiled[0] == key:
+            return compiled[1]
+        with self._lock:
+            compiled = self._compiled
+            if compiled is None or compiled[0] != key:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    source = f.read()
+                if self.transform is not None:
+                    source = self.transform(source)
+                template = Template(source, self.constants)
+                template.mtime = st.st_mtime
+                compiled = self._compiled = (key, template)
+            return compiled[1]
@@ -0,0 +1,85 @@
+"""
+Test helpers for Schedule Server
+Sebas Osorio
+
+Starts server.py as a subprocess in a scratch directory (with static/
+linked in), so logs, caches and uploads never land in the working tree.
+"""
+
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Unit tests import the server's modules directly
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Seconds to wait for the server to accept connections
+STARTUP_TIMEOUT = 15.0
+
+
+def free_port() -> int:
+    """Ask the kernel for an unused localhost port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ServerProcess:
+    """server.py running on a free localhost port for the length of a with block."""
+
+    def __init__(self, env: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            env: Settings passed to the server on top of the test defaults
+        """
+        self.env = env or {}
+        self.port = free_port()
+        self.workdir: Optional[str] = None
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "ServerProcess":
+        self.workdir = tempfile.mkdtemp(prefix="schedule-test-")
+        os.symlink(os.path.join(ROOT, "static"), os.path.join(self.workdir, "static"))
+        os.mkdir(os.path.join(self.workdir, "files"))
+        env = dict(os.environ, HOST="127.0.0.1", PORT=str(self.port), EVENTS_FSYNC="false",
+                   RATE_LIMIT_STATIC_RPS="0", RATE_LIMIT_DYNAMIC_RPS="0")
+        env.update(self.env)
+        self.output = open(os.path.join(self.workdir, "server.out"), "w")
+        self.process = subprocess.Popen([sys.executable, os.path.join(ROOT, "server.py")],
+                                        cwd=self.workdir, env=env,
+                                        stdout=self.output, stderr=subprocess.STDOUT)
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                self.__exit__(None, None, None)
+                raise RuntimeError(f"server.py exited with status {self.process.returncode}")
+            try:
+                socket.create_connection(("127.0.0.1", self.port), timeout=0.2).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+        self.__exit__(None, None, None)
+        raise RuntimeError(f"server.py did not listen on port {self.port}")
+
+    def __exit__(self, *exc_info) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.output.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def path(self, *parts: str) -> str:
+        """Path of a file inside the server's scratch directory."""
+        return os.path.join(self.workdir, *parts)
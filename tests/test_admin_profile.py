@@ -0,0 +1,45 @@
+"""
+Profiling admin endpoint tests for Schedule Server
+Sebas Osorio
+"""
+
+import http.client
+import json
+import unittest
+from urllib.parse import urlencode
+
+from support import ServerProcess
+
+TOKEN = "s3cret-admin-token"
+
+
+class AdminProfileTest(unittest.TestCase):
+
+    def request(self, server: ServerProcess, method: str, path: str, body: str = None,
+                headers: dict = None) -> http.client.HTTPResponse:
+        connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+        connection.request(method, path, body, headers or {})
+        response = connection.getresponse()
+        response.body = response.read()
+        connection.close()
+        return response
+
+    def test_token_comes_from_headers_and_settings_from_the_form(self):
+        with ServerProcess({"ADMIN_TOKEN": TOKEN, "DEBUG": "false"}) as server:
+            self.assertEqual(self.request(server, "GET", f"/admin/profile?token={TOKEN}").status, 403)
+            self.assertEqual(self.request(server, "GET", "/admin/profile",
+                                          headers={"Authorization": "Bearer wrong"}).status, 403)
+            self.assertEqual(self.request(server, "GET", "/admin/profile",
+                                          headers={"X-Admin-Token": TOKEN}).status, 200)
+
+            response = self.request(server, "POST", "/admin/profile", urlencode({"enable": "1", "sample": "0.5"}),
+                                    {"Authorization": f"Bearer {TOKEN}",
+                                     "Content-Type": "application/x-www-form-urlencoded"})
+            self.assertEqual(response.status, 200)
+            status = json.loads(response.body)
+            self.assertTrue(status["enabled"])
+            self.assertEqual(status["sample_rate"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""
+Admission control tests for Schedule Server
+Sebas Osorio
+"""
+
+import http.client
+import socket
+import time
+import unittest
+
+from support import ServerProcess
+
+# Settings under which a client gets one dynamic request and is then over its rate
+ONE_DYNAMIC_REQUEST = {"RATE_LIMIT_DYNAMIC_RPS": "0.001", "RATE_LIMIT_DYNAMIC_BURST": "1"}
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def assert_upload_shed_unread(self, mode: str) -> None:
+        with ServerProcess(dict(ONE_DYNAMIC_REQUEST, SERVER_MODE=mode)) as server:
+            connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+            connection.request("GET", "/api/events")
+            self.assertEqual(connection.getresponse().status, 200)
+            connection.close()
+
+            # Announce a large upload but send none of it: the rejection must not wait for it
+            started = time.monotonic()
+            with socket.create_connection(("127.0.0.1", server.port), timeout=5) as sock:
+                sock.sendall(b"POST /upload HTTP/1.1\r\nHost: localhost\r\n"
+                             b"Content-Type: application/octet-stream\r\n"
+                             b"Content-Length: 50000000\r\n\r\n")
+                reply = sock.makefile("rb")
+                status = reply.readline()
+                head = b""
+                for line in iter(reply.readline, b"\r\n"):
+                    head += line
+            self.assertIn(b" 429 ", status)
+            self.assertIn(b"Retry-After:", head)
+            self.assertIn(b"Connection: close", head)
+            self.assertLess(time.monotonic() - started, 2.0)
+
+    def test_threaded_mode_sheds_uploads_before_reading_them(self):
+        self.assert_upload_shed_unread("threaded")
+
+    def test_async_mode_sheds_uploads_before_reading_them(self):
+        self.assert_upload_shed_unread("async")
+
+
+if __name__ == "__main__":
+    unittest.main()
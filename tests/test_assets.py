@@ -0,0 +1,47 @@
+"""
+Asset minification tests for Schedule Server
+Sebas Osorio
+"""
+
+import unittest
+
+import support  # noqa: F401  (puts the repository on sys.path)
+from assets import minify_js
+
+
+class MinifyJsTest(unittest.TestCase):
+
+    def test_comments_and_indentation_are_dropped(self):
+        source = "// header\nfunction f(a) {\n    /* block */ return a;  // trailing\n}\n\n"
+        self.assertEqual(minify_js(source), "function f(a) {\nreturn a;\n}")
+
+    def test_strings_and_template_literals_are_kept(self):
+        source = "var u = \"http://a/*b*/\" + 'c//d';\nvar t = `one\n    two // three`;\n"
+        self.assertEqual(minify_js(source), source.strip())
+
+    def test_regex_literals_are_kept(self):
+        for source in ('s.replace(/\\/\\/ "x/g, "")',
+                       "var re = /[/']/;",
+                       "if (/'/.test(s)) { f() }",
+                       "return /a*\\//.test(s)",
+                       "x = a ? /b/ : /c/"):
+            with self.subTest(source=source):
+                self.assertEqual(minify_js(source + " // note"), source)
+
+    def test_division_is_not_taken_for_a_regex(self):
+        # Read as a regex, the '/' pairs with the one in the first string and
+        # the quotes shift, so the '//' inside the second string looks like a comment
+        for source in ('x = a / 2 + "a/b" + "c // d"',
+                       'x = (a + b) / 2 + "a/b" + "c // d"',
+                       'x = v[0] / 2 + "a/b" + "c // d"',
+                       'x = i++ / 2 + "a/b" + "c // d"',
+                       'x = j-- / 2 + "a/b" + "c // d"'):
+            with self.subTest(source=source):
+                self.assertEqual(minify_js(source + " // note"), source)
+
+    def test_regex_after_an_operator(self):
+        self.assertEqual(minify_js('x = a + /"/.source; // note'), 'x = a + /"/.source;')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""
+Event store tests for Schedule Server
+Sebas Osorio
+"""
+
+import json
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import support  # noqa: F401  (puts the repository on sys.path)
+from event_store import NO_TIME, EventStore, StoreError, parse_time, words
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri")
+LOCATIONS = ("Keller Hall", "Coffman Union", "Walter Library", " keller hall ")
+NAMES = ("Algorithms lecture", "Databases lab", "Office hours", "Lunch", "Algebra review", "Run")
+
+
+def event(name: str = "Lunch", day: str = "Mon", start: str = "12:00", end: str = "13:00",
+          location: str = "Coffman Union", info: str = "") -> dict:
+    return {"eventname": name, "dayofweek": day, "starttime": start, "endtime": end,
+            "phonenumber": "", "location": location, "extrainfo": info, "url": ""}
+
+
+class EventStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix="schedule-store-")
+        self.path = os.path.join(self.directory, "events.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def add_concurrently(self, store: EventStore, writers: int) -> list:
+        """Call store.add from several threads at once; returns what each raised (None if nothing)."""
+        raised = [None] * writers
+        start = threading.Barrier(writers)
+
+        def write(number: int) -> None:
+            start.wait()
+            try:
+                store.add(event(name=f"Writer {number}"))
+            except BaseException as e:
+                raised[number] = e
+
+        threads = [threading.Thread(target=write, args=(number,)) for number in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return raised
+
+    def test_failed_fsync_is_reported_to_every_writer(self):
+        store = EventStore(self.path, fsync=True, commit_delay=0.2)
+        with mock.patch("event_store.os.fsync", side_effect=OSError(5, "Input/output error")), \
+                self.assertLogs("personal_website", "ERROR"):
+            raised = self.add_concurrently(store, 6)
+        for error in raised:
+            self.assertIsInstance(error, StoreError)
+
+        # The store keeps working once the disk does
+        store.add(event(name="After the failure"))
+        self.assertEqual(store.events()[-1]["eventname"], "After the failure")
+
+    def test_unexpected_error_fails_every_writer_and_reaches_the_leader(self):
+        store = EventStore(self.path, fsync=True, commit_delay=0.2)
+        with mock.patch("event_store.os.fsync", side_effect=RuntimeError("boom")), \
+                self.assertLogs("personal_website", "ERROR"):
+            raised = self.add_concurrently(store, 6)
+        self.assertTrue(all(isinstance(error, (StoreError, RuntimeError)) for error in raised), raised)
+        self.assertTrue(any(isinstance(error, RuntimeError) for error in raised))
+        store.add(event(name="After the failure"))
+        self.assertEqual(len(store.query(text="after failure")), 1)
+
+    def test_recovery_cuts_a_torn_last_line(self):
+        with open(self.path, "wb") as f:
+            f.write(json.dumps(event(name="First")).encode() + b"\n")
+            f.write(json.dumps(event(name="Second")).encode() + b"\n")
+            f.write(b'{"eventname": "Torn", "dayofw')
+
+        with self.assertLogs("personal_website", "ERROR"):
+            store = EventStore(self.path, fsync=False)
+        self.assertEqual([e["eventname"] for e in store.events()], ["First", "Second"])
+        with open(self.path, "rb") as f:
+            self.assertTrue(f.read().endswith(b"\n"))
+
+        # New events start on a line of their own and survive a restart
+        store.add(event(name="Third"))
+        reopened = EventStore(self.path, fsync=False)
+        self.assertEqual([e["eventname"] for e in reopened.events()], ["First", "Second", "Third"])
+        self.assertEqual(reopened.corrupt_lines, 0)
+
+    def test_recovery_skips_lines_that_are_not_events(self):
+        with open(self.path, "wb") as f:
+            for line in (json.dumps(event(name="Kept")), "[]", "1", '"text"', "{not json"):
+                f.write(line.encode() + b"\n")
+        store = EventStore(self.path, fsync=False)
+        self.assertEqual([e["eventname"] for e in store.events()], ["Kept"])
+        self.assertEqual(store.corrupt_lines, 4)
+
+    def test_indexes_agree_with_a_linear_scan(self):
+        rng = random.Random(20261017)
+        store = EventStore(self.path, fsync=False)
+        events = []
+        for _ in range(300):
+            start = rng.choice([f"{rng.randrange(7, 20):02d}:{rng.choice(['00', '15', '30'])}", "", "late"])
+            end = rng.choice([f"{rng.randrange(8, 22):02d}:{rng.choice(['00', '45'])}", ""])
+            events.append(event(rng.choice(NAMES), rng.choice(DAYS), start, end,
+                                rng.choice(LOCATIONS), rng.choice(["", "bring laptop", "room 3-180"])))
+        store.add_many(events[:150])
+        for record in events[150:]:
+            store.add(record)
+
+        def scan(dayofweek=None, start_from=None, start_until=None, end_until=None, location=None, text=None):
+            matched = []
+            for event_id, record in enumerate(events):
+                start, end = parse_time(record["starttime"]), parse_time(record["endtime"])
+                if dayofweek is not None and record["dayofweek"] != dayofweek:
+                    continue
+                if (start_from is not None or start_until is not None) and (
+                        start is None or start < (start_from or 0) or start > (start_until or NO_TIME - 1)):
+                    continue
+                if end_until is not None and (end is None or end > end_until):
+                    continue
+                if location is not None and record["location"].strip().lower() != location.strip().lower():
+                    continue
+                if text is not None:
+                    terms = words(text)
+                    have = words(record["eventname"]) + words(record["extrainfo"])
+                    if not terms or not all(any(word.startswith(term) for word in have) for term in terms):
+                        continue
+                matched.append(event_id)
+            return matched
+
+        filters = [
+            {}, {"dayofweek": "Tue"}, {"dayofweek": "Sun"}, {"start_from": 9 * 60},
+            {"start_until": 12 * 60}, {"start_from": 10 * 60, "start_until": 14 * 60, "dayofweek": "Wed"},
+            {"end_until": 13 * 60}, {"location": "KELLER HALL"}, {"location": "nowhere"},
+            {"text": "alg"}, {"text": "algorithms lec"}, {"text": "lab laptop"}, {"text": "--"},
+            {"text": "run", "dayofweek": "Fri", "end_until": 18 * 60},
+            {"text": "office", "location": "walter library", "start_from": 8 * 60},
+        ]
+        for query in filters:
+            with self.subTest(**query):
+                got = [event_id for event_id, _ in store.query_ids(**query)]
+                expected = scan(**query)
+                if "dayofweek" in query or "start_from" in query or "start_until" in query:
+                    self.assertEqual(sorted(got), expected)
+                    if "dayofweek" in query:
+                        # One day: ordered by start time, then submission order
+                        starts = [parse_time(events[event_id]["starttime"]) for event_id in got]
+                        keys = [(NO_TIME if start is None else start, event_id)
+                                for start, event_id in zip(starts, got)]
+                        self.assertEqual(keys, sorted(keys))
+                else:
+                    self.assertEqual(got, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+File explorer download tests for Schedule Server
+Sebas Osorio
+"""
+
+import re
+import unittest
+import urllib.error
+import urllib.request
+import uuid
+from urllib.parse import urljoin
+
+from support import ServerProcess
+
+
+def upload(base: str, filename: str, content: bytes, content_type: str) -> bytes:
+    """POST one file to the explorer's upload form and return the listing it answers with."""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n').encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(base + "/html/upload", data=body, method="POST", headers={
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+    })
+    with urllib.request.urlopen(request) as response:
+        return response.read()
+
+
+def listed_link(page: bytes, filename: str) -> str:
+    match = re.search(rf'<a href="([^"]+)">{re.escape(filename)}</a>'.encode(), page)
+    assert match is not None, f"{filename} is not listed"
+    return match.group(1).decode()
+
+
+class ExplorerFilesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ServerProcess({"SERVER_MODE": "threaded"}).__enter__()
+        cls.base = f"http://127.0.0.1:{cls.server.port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.__exit__(None, None, None)
+
+    def test_uploaded_file_is_served_at_its_listed_link(self):
+        content = b"uploaded through the explorer\n"
+        upload(self.base, "up.txt", content, "text/plain")
+        with urllib.request.urlopen(self.base + "/html/explorer.html") as response:
+            link = listed_link(response.read(), "up.txt")
+        with urllib.request.urlopen(urljoin(self.base + "/html/explorer.html", link)) as response:
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.headers["Content-Type"], "text/plain")
+            self.assertEqual(response.read(), content)
+
+    def test_binary_upload_supports_ranges(self):
+        content = bytes(range(256)) * 64
+        page = upload(self.base, "clip.mp3", content, "audio/mpeg")
+        link = urljoin(self.base + "/html/explorer.html", listed_link(page, "clip.mp3"))
+        request = urllib.request.Request(link, headers={"Range": "bytes=100-199"})
+        with urllib.request.urlopen(request) as response:
+            self.assertEqual(response.status, 206)
+            self.assertEqual(response.read(), content[100:200])
+            self.assertEqual(response.headers["Cache-Control"], "public, max-age=86400")
+
+    def test_unlisted_file_types_are_not_served(self):
+        with open(self.server.path("files", "settings.cfg"), "w") as f:
+            f.write("password=hunter2\n")
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(self.base + "/html/files/settings.cfg")
+        self.assertEqual(raised.exception.code, 404)
+        self.assertNotIn(b"hunter2", raised.exception.read())
+
+    def test_paths_outside_files_are_not_served(self):
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(self.base + "/html/files/..%2F..%2Fserver.py")
+        self.assertEqual(raised.exception.code, 404)
+        self.assertNotIn(b"import", raised.exception.read())
+
+    def test_sample_pages_still_load_their_images(self):
+        with urllib.request.urlopen(self.base + "/html/files/cute_puppy.jpg") as response:
+            self.assertEqual(response.headers["Content-Type"], "image/jpeg")
+
+
+if __name__ == "__main__":
+    unittest.main()
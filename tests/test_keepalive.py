@@ -0,0 +1,82 @@
+"""
+Connection persistence tests for Schedule Server
+Sebas Osorio
+"""
+
+import http.client
+import json
+import socket
+import time
+import unittest
+
+from support import ServerProcess
+
+
+class KeepAliveTest(unittest.TestCase):
+
+    def assert_idle_client_blocks_nobody(self, env: dict) -> None:
+        with ServerProcess(dict(env, KEEPALIVE_TIMEOUT="5")) as server:
+            idle = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+            idle.request("GET", "/css/stylesheet.css")
+            response = idle.getresponse()
+            response.read()
+            self.assertEqual(response.getheader("Connection"), "close")
+
+            # The first connection is left open and idle while a second client asks
+            started = time.monotonic()
+            other = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+            other.request("GET", "/css/stylesheet.css")
+            self.assertEqual(other.getresponse().status, 200)
+            self.assertLess(time.monotonic() - started, 1.0)
+            other.close()
+            idle.close()
+
+    def test_single_mode_closes_so_an_idle_client_blocks_nobody(self):
+        self.assert_idle_client_blocks_nobody({"SERVER_MODE": "single"})
+
+    def test_pool_mode_closes_so_an_idle_client_holds_no_worker(self):
+        self.assert_idle_client_blocks_nobody({"SERVER_MODE": "pool", "WORKERS": "1"})
+
+    def test_threaded_mode_keeps_connections_open(self):
+        with ServerProcess({"SERVER_MODE": "threaded"}) as server:
+            connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+            for _ in range(2):
+                connection.request("GET", "/css/stylesheet.css")
+                response = connection.getresponse()
+                response.read()
+                self.assertEqual(response.status, 200)
+                self.assertIsNone(response.getheader("Connection"))
+                self.assertIn("timeout=", response.getheader("Keep-Alive"))
+            connection.close()
+
+    def assert_unframed_body_refused(self, mode: str) -> None:
+        smuggled = b"GET /calculator?digit1=6&operator=multiply&digit2=7 HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        chunked = b"%x\r\n%s\r\n0\r\n\r\n" % (len(smuggled), smuggled)
+        with ServerProcess({"SERVER_MODE": mode}) as server:
+            for framing, status in ((b"Transfer-Encoding: chunked\r\n", b" 411 "),
+                                    (b"Transfer-Encoding: chunked\r\nContent-Length: 5\r\n", b" 400 ")):
+                with socket.create_connection(("127.0.0.1", server.port), timeout=10) as sock:
+                    sock.sendall(b"POST /EventLog.html HTTP/1.1\r\nHost: localhost\r\n"
+                                 b"Content-Type: application/x-www-form-urlencoded\r\n"
+                                 + framing + b"\r\n" + chunked)
+                    # The server answers once and closes, so the body is never read as a request
+                    reply = b""
+                    for data in iter(lambda: sock.recv(65536), b""):
+                        reply += data
+                self.assertTrue(reply.startswith(b"HTTP/1."), reply[:80])
+                self.assertIn(status, reply.split(b"\r\n", 1)[0])
+                self.assertEqual(reply.count(b"HTTP/1."), 1)
+
+            connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=10)
+            connection.request("GET", "/api/events")
+            self.assertEqual(json.loads(connection.getresponse().read())["total"], 0)
+            connection.close()
+
+    def test_threaded_mode_refuses_bodies_not_framed_by_content_length(self):
+        self.assert_unframed_body_refused("threaded")
+
+    def test_async_mode_refuses_bodies_not_framed_by_content_length(self):
+        self.assert_unframed_body_refused("async")
+
+if __name__ == "__main__":
+    unittest.main()